@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+from csv_loader import source_file
+from worker_pool import map_jobs
+
+# Bump when the shape of a cached per-file result changes so old entries are recomputed
+CACHE_VERSION = 4
+
+CACHE_DIR = os.environ.get("AGGREGATE_CACHE_DIR", ".aggregate_cache")
+
+# dataset -> (mtime_ns of the cache file, parsed contents)
+_memory = {}
+
+def file_signature(file_path, institucion):
+    # ZIP members are signed by their archive, which is replaced whenever it is re-downloaded
+    st = os.stat(source_file(file_path))
+    return {"size": st.st_size, "mtime": st.st_mtime_ns, "institucion": institucion}
+
+def _cache_path(dataset):
+    return os.path.join(CACHE_DIR, f"{dataset}.json")
+
+def load_cache(dataset):
+    path = _cache_path(dataset)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    cached = _memory.get(dataset)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable cache {path}: {e}")
+        return {}
+
+    if data.get("version") != CACHE_VERSION:
+        return {}
+
+    entries = data.get("files", {})
+    _memory[dataset] = (mtime, entries)
+    return entries
+
+def save_cache(dataset, entries):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(dataset)
+
+    # Write to a temp file and rename so concurrent workers never read half a cache
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{dataset}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _memory[dataset] = (os.stat(path).st_mtime_ns, entries)
+
+def _folder(file_path):
+    return os.path.abspath(os.path.dirname(source_file(file_path)) or ".")
+
+# Returns compute(file_path, institucion) for every job, only re-processing files whose
+# size, mtime or institution changed. `jobs` is the listing of `folder`: entries of that folder
+# it no longer holds are evicted (e.g. a ZIP member replaced by its .csv.gz copy), as are
+# entries whose source file disappeared. Stale files are recomputed through worker_pool, in
+# parallel when workers > 1.
+def cached_results(dataset, jobs, compute, workers=None, folder=None):
+    entries = load_cache(dataset)
+    fresh = {}
+    changed = False
+
+    signatures = [file_signature(file_path, institucion) for file_path, institucion in jobs]
+    stale = [
+        job for job, signature in zip(jobs, signatures)
+        if job[0] not in entries or entries[job[0]]["signature"] != signature
+    ]
+
+    for file_path, _ in stale:
+        print(f"🔄 Aggregating {file_path}")
+    computed = dict(zip([file_path for file_path, _ in stale], map_jobs(compute, stale, workers)))
+
+    results = []
+    for (file_path, _), signature in zip(jobs, signatures):
+        if file_path in computed:
+            result = computed[file_path]
+            changed = True
+        else:
+            result = entries[file_path]["result"]
+
+        fresh[file_path] = {"signature": signature, "result": result}
+        results.append(result)
+
+    # Keep entries for files outside this run (e.g. another download_dir) while they still exist
+    listed = None if folder is None else os.path.abspath(folder)
+    evicted = set()
+    for file_path, entry in entries.items():
+        if file_path in fresh:
+            continue
+        if _folder(file_path) != listed and os.path.exists(source_file(file_path)):
+            fresh[file_path] = entry
+        else:
+            evicted.add(file_path)
+
+    if evicted:
+        print(f"🧹 Evicting {len(evicted)} stale cache entr{'y' if len(evicted) == 1 else 'ies'} from {dataset}")
+        changed = True
+
+    if changed:
+        save_cache(dataset, fresh)
+
+    return results
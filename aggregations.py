@@ -0,0 +1,111 @@
+import pandas as pd
+from date_parsing import infer_format, parse_dates, unparsed_values
+
+def top_bottom(grouped, n=10):
+    top = grouped.sort_values(ascending=False).head(n)
+    bottom = grouped.sort_values(ascending=True).head(n)
+    return [("top", top), ("bottom", bottom)]
+
+# Folds a {"YYYY-MM": n} series into the legacy {"%m": n} histogram, optionally keeping only
+# some years
+def fold_months(serie, years=None):
+    meses = {}
+    for anio_mes, cantidad in serie.items():
+        if years is not None and int(anio_mes[:4]) not in years:
+            continue
+        mes = anio_mes[5:7]
+        meses[mes] = meses.get(mes, 0) + cantidad
+    return meses
+
+# Rows and summed `valores` per name and year-month (year and month 0 for rows without a
+# usable date), in the order the keys first appear. `fechas` must already be parsed; `valores`
+# defaults to 1 per row.
+def monthly_totals(nombres, fechas, valores=None):
+    if valores is None:
+        valores = pd.Series(1, index=nombres.index)
+    keep = nombres.notna()
+    fechas = fechas[keep].dt
+    anios = fechas.year.fillna(0).astype("int64")
+    meses = fechas.month.fillna(0).astype("int64")
+    return valores[keep].groupby([nombres[keep], anios, meses], observed=True, sort=False).agg(["size", "sum"])
+
+# Partial totals a chunked read keeps before summing them into one
+PENDING_PARTS = 8
+
+# Sums the monthly_totals of consecutive parts of a file (e.g. chunks) into the totals of the
+# whole file, keys still in order of first appearance
+def merge_totals(partes):
+    if len(partes) == 1:
+        return partes[0]
+    return pd.concat(partes).groupby(level=[0, 1, 2], observed=True, sort=False).sum()
+
+# Monthly totals of every key column of a file read as consecutive frames (the chunks of a
+# chunked read, or the whole file as a single frame): each frame is reduced and dropped, and
+# pending totals are summed every PENDING_PARTS frames, so memory stays flat however large the
+# file is. `claves` are (fuente, column) pairs and `valores(frame)` gives the values summed
+# into cantidad (None counts rows). Every frame's `fecha_columna` is parsed with the format of
+# the file's first date. Returns (that date parsed, {fuente: facts}, {unparsed value: rows}).
+def reduce_frames(frames, claves, fecha_columna, valores=None, dayfirst=True, schema=None):
+    primera = formato = None
+    no_parseadas = {}
+    partes = {fuente: [] for fuente, _ in claves}
+
+    for frame in frames:
+        fechas = frame[fecha_columna]
+        primera_fila = None
+        if formato is None:
+            non_empty = fechas.dropna()
+            if not non_empty.empty:
+                primera_fila = non_empty.index[0]
+                formato = infer_format(non_empty.iloc[0], dayfirst=dayfirst, schema=schema)
+
+        parseadas = parse_dates(fechas, dayfirst=dayfirst, formato=formato)
+        if primera_fila is not None:
+            primera = parseadas.loc[primera_fila]
+        for valor, filas in unparsed_values(fechas, parseadas).items():
+            no_parseadas[valor] = no_parseadas.get(valor, 0) + filas
+
+        cantidades = None if valores is None else valores(frame)
+        for fuente, columna in claves:
+            partes[fuente].append(monthly_totals(frame[columna], parseadas, cantidades))
+            if len(partes[fuente]) >= PENDING_PARTS:
+                partes[fuente] = [merge_totals(partes[fuente])]
+
+    hechos = {fuente: facts_from_totals(merge_totals(p)) if p else {} for fuente, p in partes.items()}
+    return primera, hechos, no_parseadas
+
+# monthly_totals as {nombre: {"YYYY-MM": [filas, cantidad]}} ("" for rows without a date)
+def facts_from_totals(totales):
+    hechos = {}
+    for (nombre, anio, mes), filas, cantidad in totales.itertuples(name=None):
+        hechos.setdefault(str(nombre), {})[f"{anio:04d}-{mes:02d}" if anio else ""] = [int(filas), int(cantidad)]
+    return hechos
+
+# Per-name and year-month totals, {nombre: {"YYYY-MM": [filas, cantidad]}} ("" for rows
+# without a usable date): the rows a file contributes to the fact store. `fechas` must already
+# be parsed; `valores` are summed into cantidad (which counts rows without it).
+def monthly_facts(nombres, fechas, valores=None):
+    return facts_from_totals(monthly_totals(nombres, fechas, valores))
+
+# The {nombre: {"YYYY-MM": rows}} series of dated rows out of monthly_facts
+def series_from_facts(hechos):
+    series = {}
+    for nombre, meses in hechos.items():
+        serie = {anio_mes: filas for anio_mes, (filas, _) in meses.items() if anio_mes}
+        if serie:
+            series[nombre] = serie
+    return series
+
+# The top/bottom-n names of a file and the month histogram ("%m" -> rows) of each, computed
+# from its monthly_facts alone, ranking by `medida` ("filas" counts rows, "cantidad" sums the
+# values). Yields (tipo, nombre, cantidad, fechas_recetadas).
+def ranked_from_facts(hechos, medida="filas", n=10):
+    indice = 0 if medida == "filas" else 1
+    totales = {nombre: sum(valores[indice] for valores in meses.values()) for nombre, meses in hechos.items()}
+    # Sorted by label like a groupby, so ties rank the same
+    grouped = pd.Series(totales, dtype="int64").sort_index()
+
+    series = series_from_facts(hechos)
+    for tipo, grupo in top_bottom(grouped, n):
+        for nombre, cantidad in grupo.items():
+            yield tipo, nombre, int(cantidad), fold_months(series.get(nombre, {}))
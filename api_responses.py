@@ -0,0 +1,90 @@
+import json
+from itertools import islice
+from flask import Response, jsonify, request, stream_with_context
+
+# Query-string filters matched against the raw fetch rows; each accepts comma-separated values
+FILTER_FIELDS = ["institucion", "tipo", "archivo"]
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+def _values(name):
+    values = set()
+    for value in request.args.getlist(name):
+        values.update(part.strip() for part in value.split(",") if part.strip())
+    return values
+
+def _non_negative(name):
+    value = request.args.get(name)
+    if value is None or value == "":
+        return None
+    number = int(value) if value.isdigit() else -1
+    if number < 0:
+        raise ValueError(f"{name} must be a non-negative integer")
+    return number
+
+def parse_years():
+    years = set()
+    for value in _values("year"):
+        if not value.isdigit():
+            raise ValueError("year must be a number, e.g. ?year=2023")
+        years.add(int(value))
+    return years or None
+
+# ?n= for rankings: how many items per side, 1 to `maximum`
+def parse_top_n(maximum, default=10):
+    value = request.args.get("n")
+    if value is None or value == "":
+        return default
+    if not value.isdigit() or not 1 <= int(value) <= maximum:
+        raise ValueError(f"n must be a number from 1 to {maximum}")
+    return int(value)
+
+# Reads filters, pagination and output format from the query string. Raises ValueError with a
+# message for the client when a parameter is malformed.
+def query_options():
+    return {
+        "filters": {field: {v.upper() for v in _values(field)} for field in FILTER_FIELDS if _values(field)},
+        "years": parse_years(),
+        "limit": _non_negative("limit"),
+        "offset": _non_negative("offset") or 0,
+        "ndjson": request.args.get("format") == "ndjson" or NDJSON_MIMETYPE in request.headers.get("Accept", "")
+    }
+
+def matches(row, options):
+    for field, wanted in options["filters"].items():
+        if str(row.get(field, "")).strip().upper() not in wanted:
+            return False
+    if options["years"] and int(str(row.get("fecha_archivo", "0000"))[:4]) not in options["years"]:
+        return False
+    return True
+
+# Filters the raw rows, maps each kept row through `project` (None drops it) and pages the
+# result lazily, so nothing is materialized beyond the page being sent. Pass
+# filter_rows=False for rows that were already filtered (e.g. before grouping them).
+def select(rows, project, options, filter_rows=True):
+    if filter_rows:
+        rows = (row for row in rows if matches(row, options))
+    selected = (project(row) for row in rows)
+    selected = (row for row in selected if row is not None)
+    stop = options["offset"] + options["limit"] if options["limit"] is not None else None
+    return islice(selected, options["offset"], stop)
+
+# A JSON array by default (what the routes always returned), or one JSON object per line with
+# ?format=ndjson, streamed from the generator as rows are produced
+def respond(rows, project, options, filter_rows=True):
+    selected = select(rows, project, options, filter_rows)
+
+    if options["ndjson"]:
+        def lines():
+            for row in selected:
+                yield json.dumps(row, ensure_ascii=False, sort_keys=True) + "\n"
+        return Response(stream_with_context(lines()), mimetype=NDJSON_MIMETYPE)
+
+    page = list(selected)
+    response = jsonify(page)
+    if options["limit"] is not None:
+        response.headers["X-Offset"] = str(options["offset"])
+        response.headers["X-Limit"] = str(options["limit"])
+        if len(page) == options["limit"]:
+            response.headers["X-Next-Offset"] = str(options["offset"] + len(page))
+    return response
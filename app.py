@@ -1,82 +1,160 @@
-from flask import Flask, jsonify, send_file
+from flask import Flask, jsonify, url_for, request
 from webscrape import run_scraper as run_meds_scraper
 from webscrapeINRPRF import run_scraper as run_studies_scraper
 from webscrapeISSSTE import run_scraper as run_egresos_scraper
 
-from fetch_meds import fetch_all_prescriptions as fetch_meds_data
-from fetch_studies import fetch_all_studies as fetch_studies_data
-from fetch_diagnosis_specialities import fetch_all_diagnosis_and_specialities as fetch_diagnosis_and_specialities
+import datasets
+import dataset_scraper
+import metadata_store
+import scrape_jobs
+import fact_store
+from aggregations import fold_months
+from api_responses import parse_top_n, query_options, respond
+from http_caching import compress_response, conditional
+from file_serving import USE_X_SENDFILE, serve_data_file
+from file_index import list_entries
 
 import os
 import json
 import os
+import threading
+from functools import partial
 import traceback
 app = Flask(__name__)
 
+# 🗜️ gzip/br for JSON responses, negotiated from Accept-Encoding
+app.after_request(compress_response)
+
+# Let the web server stream /download files (see file_serving.py)
+app.config["USE_X_SENDFILE"] = USE_X_SENDFILE
+
+# ------------------ CACHE WARMUP ------------------
+
+def warm_cache():
+    for name in datasets.DATASETS:
+        try:
+            datasets.fetch_function(name)()
+            print(f"🔥 Cache warmed: {name}")
+        except Exception as e:
+            print(f"❌ Cache warmup failed for {name}: {e}")
+
+@app.cli.command("warm-cache")
+def warm_cache_command():
+    warm_cache()
+
+@app.cli.command("stage-files")
+def stage_files_command():
+    for name in datasets.DATASETS:
+        datasets.stage_all(name)
+
+# Moves legacy .meta.txt institutions into each folder's metadata store and fills in row
+# counts, date ranges and schema fingerprints for files staged before the store existed
+@app.cli.command("migrate-metadata")
+def migrate_metadata_command():
+    for name in datasets.DATASETS:
+        stage_file = datasets.fetcher(name).stage_file
+        for file_path, institucion in datasets.list_files(name):
+            folder, file_name = metadata_store.locate(file_path)
+            if metadata_store.describe(folder).get(file_name, {}).get("rows") is None:
+                stage_file(file_path, institucion)
+
+if os.environ.get("WARM_CACHE_ON_STARTUP") == "1":
+    threading.Thread(target=warm_cache, daemon=True).start()
+
 @app.route("/")
 def index():
     return "✅ Prescription scraping API is up."
 
 # ------------------ SCRAPE ROUTES ------------------
 
+# Scrapes run as background jobs: the route answers right away with a job id and
+# /scrape-jobs/<job_id> reports progress
+
+def enqueue_scrape(dataset, run_scraper, download_dir, label):
+    job, created = scrape_jobs.submit(dataset, run_scraper, download_dir)
+    return jsonify({
+        "status": f"Scraping {label} queued ⏳" if created else f"Scraping {label} already in progress ⏳",
+        "job_id": job["id"],
+        "job": job,
+        "status_url": url_for("scrape_job_status", job_id=job["id"])
+    }), 202
+
 @app.route("/run-scrape-meds")
 def scrape_meds():
-    try:
-        run_meds_scraper()
-        return jsonify({"status": "Scraping meds done ✅"})
-    except Exception as e:
-        import traceback
-        return jsonify({
-            "status": "Scraping meds failed ❌",
-            "error": str(e),
-            "trace": traceback.format_exc()
-        }), 500
+    return enqueue_scrape("meds", run_meds_scraper, "Webscrapping", "meds")
 
 @app.route("/run-scrape-studies")
 def scrape_studies():
-    try:
-        run_studies_scraper()
-        return jsonify({"status": "Scraping studies done ✅"})
-    except Exception as e:
-        import traceback
-        return jsonify({
-            "status": "Scraping studies failed ❌",
-            "error": str(e),
-            "trace": traceback.format_exc()
-        }), 500
+    return enqueue_scrape("studies", run_studies_scraper, "Webscrapping", "studies")
 
 @app.route("/run-scrape-diagnosis-specialities")
 def scrape_egresos():
-    try:
-        run_egresos_scraper()
-        return jsonify({"status": "Scraping egresos done ✅"})
-    except Exception as e:
-        import traceback
-        return jsonify({
-            "status": "Scraping egresos failed ❌",
-            "error": str(e),
-            "trace": traceback.format_exc()
-        }), 500
+    return enqueue_scrape("egresos", run_egresos_scraper, "Webscrapping_ISSSTE", "egresos")
+
+# Any dataset of the registry (datasets.py), including ones without a dedicated route above
+@app.route("/run-scrape/<dataset>")
+def scrape_dataset(dataset):
+    if dataset not in datasets.DATASETS:
+        return {"error": f"Unknown dataset: {dataset}", "datasets": list(datasets.DATASETS)}, 404
+    spec = datasets.get(dataset)
+    return enqueue_scrape(dataset, partial(dataset_scraper.run, dataset), spec["download_dir"], dataset)
+
+@app.route("/scrape-jobs")
+def scrape_jobs_list():
+    return jsonify(scrape_jobs.list_jobs())
+
+@app.route("/scrape-jobs/<job_id>")
+def scrape_job_status(job_id):
+    job = scrape_jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Job not found"}, 404
+    return jsonify(job)
 
 # ------------------ FETCH ROUTES ------------------
+# All fetch routes accept ?institucion=, ?tipo=, ?archivo= and ?year= filters, ?limit=/?offset=
+# pagination and ?format=ndjson for a streamed response (see api_responses.py). They read
+# from the fact store (fact_store.py), which is brought up to date first: only new or
+# changed files are aggregated and loaded.
+
+# The per-file top/bottom rows of dataset `name` (of one fuente when given), filtered in SQL
+# and read lazily, so a response can stream them as they come
+def stored_rows(name, options, fuente=None):
+    datasets.aggregate(name)
+    return fact_store.ranked_rows(name, options, folder=datasets.get(name)["download_dir"], fuente=fuente)
+
+# Monthly totals of a fact store dataset of `name`, in the measure its histograms show, over
+# the files the ?institucion= / ?archivo= filters keep
+def stored_series(name, store, options, por_archivo=False):
+    spec = datasets.get(name)
+    filters = options["filters"]
+    return fact_store.monthly_totals(
+        store, options["years"], por_archivo=por_archivo, medida=spec["series_measure"], folder=spec["download_dir"],
+        instituciones=filters.get("institucion"), archivos=filters.get("archivo")
+    )
+
 @app.route("/medicinas-externas")
+@conditional("Webscrapping")
 def get_medicinas_externas():
     try:
-        all_data, _ = fetch_meds_data()
+        options = query_options()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        all_data = stored_rows("meds", options)
 
         # Return only the required fields, no 'id'
-        enriched = []
-        for row in all_data:
-            enriched.append({
+        def project(row):
+            return {
                 "archivo": row["archivo"],
                 "tipo": row["tipo"],
                 "institucion": row["institucion"],
                 "medicamento": row["medicamento"],
                 "cantidad": row["cantidad"],
                 "fechaArchivo": row["fecha_archivo"]
-            })
+            }
 
-        return jsonify(enriched)
+        return respond(all_data, project, options, filter_rows=False)
 
     except Exception as e:
         return jsonify({
@@ -86,22 +164,27 @@ def get_medicinas_externas():
         }), 500
 
 @app.route("/estudios-externos")
+@conditional("Webscrapping")
 def get_estudios_externos():
     try:
-        all_data = fetch_studies_data()  # must point to your updated fetch_all_prescriptions()
+        options = query_options()
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-        filtered = []
-        for row in all_data:
-            filtered.append({
+    try:
+        all_data = stored_rows("studies", options)
+
+        def project(row):
+            return {
                 "archivo": row["archivo"],
                 "cantidad": row["cantidad"],
                 "fecha_archivo": row["fecha_archivo"],
                 "institucion": row["institucion"],
                 "nombre_estudio": row["nombre_estudio"],
                 "tipo": row["tipo"]
-            })
+            }
 
-        return jsonify(filtered)
+        return respond(all_data, project, options, filter_rows=False)
 
     except Exception as e:
         return jsonify({
@@ -111,13 +194,18 @@ def get_estudios_externos():
         }), 500
 
 @app.route("/diagnosis-specialities-externos")
+@conditional("Webscrapping_ISSSTE")
 def get_egresos_externos():
     try:
-        data = fetch_diagnosis_and_specialities()
+        options = query_options()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        data = stored_rows("egresos", options)
 
-        filtered = []
-        for row in data:
-            filtered.append({
+        def project(row):
+            return {
                 "archivo": row["archivo"],
                 "cantidad": row["cantidad"],
                 "fecha_archivo": row["fecha_archivo"],
@@ -125,9 +213,9 @@ def get_egresos_externos():
                 "institucion": row["institucion"],
                 "nombre": row["nombre"],
                 "tipo": row["tipo"]
-            })
+            }
 
-        return jsonify(filtered)
+        return respond(data, project, options, filter_rows=False)
 
     except Exception as e:
         return jsonify({
@@ -139,49 +227,83 @@ def get_egresos_externos():
 
 # ------------------ FILE MANAGEMENT ------------------
 
+# Names plus, under "details", size, mtime, sha256, institution, dataset and year of every
+# file, served from file_index instead of scanning the folder on each request
+
 @app.route("/list-files")
+@conditional("Webscrapping")
 def list_files():
-    folder = "Webscrapping"
-    files = os.listdir(folder) if os.path.exists(folder) else []
-    return {"files": files}
+    details = list_entries("Webscrapping")
+    return {"files": [entry["name"] for entry in details], "details": details}
 
 @app.route("/list-egresos-files")
+@conditional("Webscrapping_ISSSTE")
 def list_egresos_files():
-    folder = "Webscrapping_Egresos"
-    files = os.listdir(folder) if os.path.exists(folder) else []
-    return {"files": files}
+    details = list_entries("Webscrapping_ISSSTE")
+    return {"files": [entry["name"] for entry in details], "details": details}
 
 @app.route("/download/<filename>")
 def download_file(filename):
-    filepath = os.path.join("Webscrapping", filename)
-    if os.path.exists(filepath):
-        return send_file(filepath, as_attachment=True)
-    else:
-        return {"error": "File not found"}, 404
+    return serve_data_file("Webscrapping", filename)
 
 @app.route("/download-egresos/<filename>")
 def download_egresos_file(filename):
-    filepath = os.path.join("Webscrapping_Egresos", filename)
-    if os.path.exists(filepath):
-        return send_file(filepath, as_attachment=True)
-    else:
-        return {"error": "File not found"}, 404
+    return serve_data_file("Webscrapping_ISSSTE", filename)
 
 # ------------------ PREDICCIONES ------------------
 
+# Monthly histograms come from the time-series store. ?year=2023 (or ?year=2022,2023) keeps
+# only those years, and ?por=anio-mes keys them by "YYYY-MM" instead of folding years into "%m".
+# The filter, pagination and ndjson options of the fetch routes apply here too.
+
+# ?formato=compacto: one entry per medication, in order of first appearance, with the
+# fechaArchivo of every file it was ranked in and a single monthly series, instead of
+# repeating the series for every top/bottom row
+def compact_meds(rows):
+    meds = {}
+    for row in rows:
+        med = row["medicamento"].strip().upper()
+        fechas = meds.setdefault(med, {"medicina": med, "fechasArchivo": []})["fechasArchivo"]
+        fecha = row.get("fecha_archivo", "2000-01-01")
+        if fecha not in fechas:
+            fechas.append(fecha)
+    return meds.values()
+
+def format_serie(serie, years):
+    if request.args.get("por") == "anio-mes":
+        return serie
+    return fold_months(serie, years)
+
 @app.route("/meds-por-mes")
+@conditional("Webscrapping")
 def meds_por_mes():
     try:
-        all_data, cantidades_por_mes = fetch_meds_data()  # update to return the new data
-        enriched = []
-        for row in all_data:
+        options = query_options()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        all_data = stored_rows("meds", options)
+        years = options["years"]
+        series = stored_series("meds", "meds", options)
+
+        if request.args.get("formato") == "compacto":
+            rows = compact_meds(all_data)
+
+            def project_compact(entry):
+                return dict(entry, fechas_recetadas=format_serie(series.get(entry["medicina"], {}), years))
+
+            return respond(rows, project_compact, options, filter_rows=False)
+
+        def project(row):
             med = row["medicamento"].strip().upper()
-            enriched.append({
+            return {
                 "medicina": med,
                 "fechaArchivo": row.get("fecha_archivo", "2000-01-01"),
-                "fechas_recetadas": cantidades_por_mes.get(med, {})
-            })
-        return jsonify(enriched)
+                "fechas_recetadas": format_serie(series.get(med, {}), years)
+            }
+
+        return respond(all_data, project, options, filter_rows=False)
     except Exception as e:
         return jsonify({
             "status": "Fetch meds por mes failed",
@@ -190,19 +312,27 @@ def meds_por_mes():
         }), 500
 
 @app.route("/studies-por-mes")
+@conditional("Webscrapping")
 def estudios_por_mes():
     try:
-        all_data = fetch_studies_data()  # already returns list with fechas_recetadas per estudio
+        options = query_options()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        all_data = stored_rows("studies", options)
+        years = options["years"]
+        series = stored_series("studies", "studies", options, por_archivo=True)
 
-        enriched = []
-        for row in all_data:
-            enriched.append({
+        def project(row):
+            serie = series.get((row["archivo"], row["nombre_estudio"]), {})
+            return {
                 "estudio": row["nombre_estudio"].strip().upper(),
                 "fechaArchivo": row.get("fecha_archivo", "2000-01-01"),
-                "fechas_recetadas": row.get("fechas_recetadas", {})
-            })
+                "fechas_recetadas": format_serie(serie, years)
+            }
 
-        return jsonify(enriched)
+        return respond(all_data, project, options, filter_rows=False)
 
     except Exception as e:
         return jsonify({
@@ -212,27 +342,33 @@ def estudios_por_mes():
         }), 500
 
 @app.route("/diagnosis-specialities-por-mes")
+@conditional("Webscrapping_ISSSTE")
 def diagnosticos_por_mes():
     try:
-        all_data = fetch_diagnosis_and_specialities()  # from your import
-
-        enriched = []
-        for row in all_data:
-            if row["fuente"] == "diagnostico":
-                enriched.append({
-                    "nombre": row["nombre"],
-                    "fechaArchivo": row["fecha_archivo"],
-                    "fechas_recetadas": row.get("fechas_recetadas", {})
-                })
-        for row in all_data:
-            if row["fuente"] == "especialidad":
-                enriched.append({
-                    "nombre": row["nombre"],
-                    "fechaArchivo": row["fecha_archivo"],
-                    "fechas_recetadas": row.get("fechas_recetadas", {})
-                })
-
-        return jsonify(enriched)
+        options = query_options()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        years = options["years"]
+        fuentes = ["diagnostico", "especialidad"]
+        # Diagnoses first, then specialities: one pass over the stored rows per fuente
+        por_fuente = [stored_rows("egresos", options, fuente) for fuente in fuentes]
+        rows = (row for fuente_rows in por_fuente for row in fuente_rows)
+        series = {
+            fuente: stored_series("egresos", f"egresos.{fuente}", options, por_archivo=True)
+            for fuente in fuentes
+        }
+
+        def project(row):
+            serie = series[row["fuente"]].get((row["archivo"], row["nombre"]), {})
+            return {
+                "nombre": row["nombre"],
+                "fechaArchivo": row["fecha_archivo"],
+                "fechas_recetadas": format_serie(serie, years)
+            }
+
+        return respond(rows, project, options, filter_rows=False)
 
     except Exception as e:
         return jsonify({
@@ -241,6 +377,119 @@ def diagnosticos_por_mes():
             "trace": traceback.format_exc()
         }), 500
 
+# ------------------ RANKINGS ------------------
+
+# Global top/bottom-N over every file, merged from the per-file rows of the fact store.
+# ?n= (default 10) items per side; ?institucion= and ?archivo= pick the per-file rows that
+# are merged, ?year= the months (by each row's own date, unlike the fetch routes' fecha_archivo
+# year, so undated rows drop out), ?tipo=top|bottom one side, and for egresos
+# ?fuente=diagnostico|especialidad one ranking. Pagination and ndjson apply as elsewhere.
+
+def ranking_response(name):
+    try:
+        options = query_options()
+        n = parse_top_n(fact_store.MAX_N)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    try:
+        # Brings the fact store up to date; cached files are not read again
+        datasets.aggregate(name)
+        folder = datasets.get(name)["download_dir"]
+
+        filters = options["filters"]
+        fuentes = {f.strip().lower() for f in request.args.get("fuente", "").split(",") if f.strip()}
+
+        rows = []
+        for store in datasets.store_datasets(name):
+            fuente = store.partition(".")[2] or None
+            if fuentes and fuente not in fuentes:
+                continue
+
+            for tipo, ranking in fact_store.top_bottom_k(
+                store, n, options["years"], filters.get("institucion"), filters.get("archivo"), folder
+            ):
+                if "tipo" in filters and tipo.upper() not in filters["tipo"]:
+                    continue
+                for posicion, (nombre, cantidad) in enumerate(ranking, 1):
+                    row = {"tipo": tipo, "posicion": posicion, "nombre": nombre, "cantidad": cantidad}
+                    if fuente:
+                        row["fuente"] = fuente
+                    rows.append(row)
+
+        return respond(rows, lambda row: row, options, filter_rows=False)
+
+    except Exception as e:
+        return jsonify({
+            "status": f"Ranking {name} failed",
+            "error": str(e),
+            "trace": traceback.format_exc()
+        }), 500
+
+@app.route("/meds-ranking")
+@conditional("Webscrapping")
+def meds_ranking():
+    return ranking_response("meds")
+
+@app.route("/studies-ranking")
+@conditional("Webscrapping")
+def studies_ranking():
+    return ranking_response("studies")
+
+@app.route("/diagnosis-specialities-ranking")
+@conditional("Webscrapping_ISSSTE")
+def diagnosis_specialities_ranking():
+    return ranking_response("egresos")
+
+# ------------------ QUERY ------------------
+
+# Parameterized aggregation over the fact store, e.g.
+#   /query?dataset=egresos.diagnostico&group_by=item,anio&year=2023&orden=desc&limit=20
+# ?dataset= one of the fact store datasets; ?group_by= any of item, institucion, archivo,
+# anio, mes, trimestre, anio_mes; ?medida=cantidad|filas; ?item=, ?institucion=, ?archivo=
+# and ?year= filters; ?desde= / ?hasta= year-month bounds; ?orden=asc|desc by total.
+# Pagination and ndjson as on the other routes.
+
+@app.route("/query")
+@conditional("Webscrapping", "Webscrapping_ISSSTE")
+def query_facts():
+    owners = datasets.store_owners()
+    dataset = request.args.get("dataset", "")
+    if dataset not in owners:
+        return {"error": f"dataset must be one of {', '.join(owners)}"}, 400
+
+    try:
+        options = query_options()
+        filters = dict(options["filters"])
+        items = {v.strip().upper() for v in request.args.get("item", "").split(",") if v.strip()}
+        if items:
+            filters["item"] = items
+        group_by = [dim.strip() for value in request.args.getlist("group_by") for dim in value.split(",") if dim.strip()]
+        group_by = group_by or ["item"]
+
+        name = owners[dataset]
+        datasets.aggregate(name)
+        rows = fact_store.query(
+            dataset, group_by,
+            medida=request.args.get("medida", "cantidad"),
+            filters=filters,
+            years=options["years"],
+            desde=request.args.get("desde"),
+            hasta=request.args.get("hasta"),
+            orden=request.args.get("orden"),
+            folder=datasets.get(name)["download_dir"]
+        )
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except Exception as e:
+        return jsonify({
+            "status": "Query failed",
+            "error": str(e),
+            "trace": traceback.format_exc()
+        }), 500
+
+    return respond(rows, lambda row: row, options, filter_rows=False)
+
 
 if __name__ == "__main__":
     app.run(debug=True)
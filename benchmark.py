@@ -0,0 +1,542 @@
+import argparse
+import os
+import sys
+import time
+import contextlib
+import io
+import json
+import multiprocessing
+import gc
+import re
+import resource
+import tempfile
+import shutil
+import tracemalloc
+import warnings
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import aggregate_cache
+import csv_loader
+import datasets
+import date_parsing
+import fetch_meds
+import staging
+import synthetic_data
+from column_names import canonical_column
+from fetch_meds import extract_file_summary as extract_meds_summary, fetch_all_prescriptions
+from fetch_studies import extract_file_summary as extract_studies, fetch_all_studies
+from fetch_diagnosis_specialities import extract_file_summary as extract_diagnosis, fetch_all_diagnosis_and_specialities
+
+def time_call(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        # Silence the per-file warnings so they don't skew timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn(*args)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def peak_memory(fn, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            fn(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return peak
+
+def bench_files(label, extract, download_dir, matches, repeat=3):
+    results = []
+    for file in sorted(os.listdir(download_dir)):
+        if not matches(file):
+            continue
+        file_path = os.path.join(download_dir, file)
+        elapsed = time_call(extract, file_path, "BENCH", repeat=repeat)
+        peak = peak_memory(extract, file_path, "BENCH")
+        results.append((file, elapsed, peak))
+        print(f"⏱️ {label:<9} {file}: {elapsed:.3f}s, peak {peak / 1e6:.1f} MB")
+
+    total = sum(elapsed for _, elapsed, _ in results)
+    print(f"⏱️ {label:<9} total: {total:.3f}s over {len(results)} file(s)")
+    return results
+
+def bench_meds(download_dir="Webscrapping", repeat=3):
+    return bench_files("meds", extract_meds_summary, download_dir, lambda f: f.endswith(".xls"), repeat)
+
+def bench_studies(download_dir="Webscrapping", repeat=3):
+    return bench_files(
+        "studies", extract_studies, download_dir,
+        lambda f: f.lower().startswith("estudios_otorga") and f.endswith(".csv.gz"), repeat
+    )
+
+def bench_diagnosis(download_dir="Webscrapping_ISSSTE", repeat=3):
+    return bench_files(
+        "diagnosis", extract_diagnosis, download_dir,
+        lambda f: f.lower().startswith("egresos") and f.endswith(".csv.gz"), repeat
+    )
+
+# Points the aggregate cache at an empty directory so fetch_all_* really aggregates every file
+@contextlib.contextmanager
+def cold_cache():
+    previous = aggregate_cache.CACHE_DIR
+    aggregate_cache.CACHE_DIR = tempfile.mkdtemp(prefix="bench_cache_")
+    aggregate_cache._memory.clear()
+    try:
+        yield
+    finally:
+        shutil.rmtree(aggregate_cache.CACHE_DIR, ignore_errors=True)
+        aggregate_cache.CACHE_DIR = previous
+        aggregate_cache._memory.clear()
+
+def bench_workers(worker_counts=None, repeat=3):
+    worker_counts = worker_counts or sorted({1, os.cpu_count() or 1})
+    results = {}
+    for label, fetch in [
+        ("meds", fetch_all_prescriptions),
+        ("studies", fetch_all_studies),
+        ("diagnosis", fetch_all_diagnosis_and_specialities)
+    ]:
+        for workers in worker_counts:
+            def cold_fetch():
+                with cold_cache():
+                    fetch(workers=workers)
+
+            elapsed = time_call(cold_fetch, repeat=repeat)
+            results[(label, workers)] = elapsed
+            print(f"⏱️ {label:<9} workers={workers}: {elapsed:.3f}s")
+    return results
+
+# Payload size and request time of /meds-por-mes in the per-row and the compact format,
+# with the aggregate cache already warm
+def bench_meds_payload(repeat=5):
+    from app import app
+
+    client = app.test_client()
+    results = {}
+
+    # What every variant pays before serializing anything
+    elapsed = time_call(fetch_all_prescriptions, repeat=repeat)
+    print(f"⏱️ {'fetch':<9} fetch_all_prescriptions (warm cache): {elapsed * 1e3:.1f} ms")
+    for label, url in [
+        ("per-row", "/meds-por-mes"),
+        ("compact", "/meds-por-mes?formato=compacto"),
+        ("per-row", "/meds-por-mes?por=anio-mes"),
+        ("compact", "/meds-por-mes?formato=compacto&por=anio-mes")
+    ]:
+        body = client.get(url).get_data()
+        elapsed = time_call(client.get, url, repeat=repeat)
+        results[url] = (len(body), elapsed)
+        print(f"⏱️ {label:<9} {url}: {len(body) / 1e3:.1f} KB, {elapsed * 1e3:.1f} ms")
+    return results
+
+# Date column of every bundled file of every dataset, read raw (not from the staged copies,
+# which already hold parsed or categorical dates)
+def bundled_date_columns():
+    columns = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, spec in datasets.DATASETS.items():
+            if not os.path.isdir(spec["download_dir"]):
+                continue
+            columns[name] = []
+            for file_path, _ in datasets.list_files(name):
+                if spec["format"] == "xls":
+                    df = fetch_meds.read_raw_frame(file_path)
+                else:
+                    df = csv_loader.read_gz_csv(file_path, [spec["date_column"]])
+                if spec["date_column"] in df.columns:
+                    columns[name].append(df[spec["date_column"]])
+    return columns
+
+def clear_date_cache():
+    date_parsing._values.clear()
+    date_parsing._formats.clear()
+
+# Parsing the date column of every bundled file: pd.to_datetime over each column (value by
+# value for the prescription sheets, as parse_emision reads them) against parse_dates with a
+# cold and with a warm cache
+def bench_dates(repeat=3):
+    results = {}
+    for name, columns in bundled_date_columns().items():
+        per_value = datasets.get(name)["format"] == "xls"
+        formato = date_parsing.PER_VALUE if per_value else None
+        rows = sum(len(column) for column in columns)
+
+        def reference():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                for column in columns:
+                    if per_value:
+                        [pd.to_datetime(valor, errors="coerce", dayfirst=True) for valor in column]
+                    else:
+                        pd.to_datetime(column, errors="coerce", dayfirst=True)
+
+        def cached():
+            for column in columns:
+                date_parsing.parse_dates(column, dayfirst=True, formato=formato)
+
+        def cold():
+            clear_date_cache()
+            cached()
+
+        for label, fn in [("to_datetime", reference), ("cold", cold), ("warm", cached)]:
+            elapsed = time_call(fn, repeat=repeat)
+            results[(name, label)] = elapsed
+            print(f"⏱️ {name:<9} dates {label:<11} {elapsed:.3f}s over {len(columns)} file(s), {rows / elapsed:,.0f} rows/s")
+    clear_date_cache()
+    return results
+
+# ------------------ REFERENCE IMPLEMENTATIONS ------------------
+
+# The code optimizations replaced, kept only so their speedups can be reproduced against the
+# current code on the same files (`python benchmark.py reference`)
+
+# Without staged copies, so both sides read the raw files
+@contextlib.contextmanager
+def raw_reads():
+    previous = staging.PARQUET_AVAILABLE
+    staging.PARQUET_AVAILABLE = False
+    try:
+        yield
+    finally:
+        staging.PARQUET_AVAILABLE = previous
+
+def _legacy_is_parseable_date(fecha):
+    try:
+        pd.to_datetime(fecha, errors="raise", dayfirst=True)
+        return True
+    except Exception:
+        return False
+
+# Prescription extraction before it was vectorized: one iterrows pass over the sheet, parsing
+# every date twice per row
+def legacy_meds_rows(file_path, institucion):
+    df = pd.read_excel(file_path, engine="xlrd", header=fetch_meds.HEADER_ROW)
+    df = df.loc[:, ~df.columns.astype(str).str.startswith("UNNAMED", na=False)]
+    df = df.loc[:, ~df.columns.duplicated()]
+    df.columns = [canonical_column(col) for col in df.columns]
+
+    fechas_dict = defaultdict(set)
+    cantidades_por_mes = defaultdict(lambda: defaultdict(int))
+    fecha_archivo_dict = defaultdict(list)
+    med_column, cantidad_column = fetch_meds.MED_COLUMN, fetch_meds.CANTIDAD_COLUMN
+    for _, row in df.iterrows():
+        med = str(row[med_column]).strip().upper()
+        fecha = row[fetch_meds.FECHA_COLUMN]
+        cantidad = row.get(cantidad_column, 0)
+        if pd.notnull(fecha) and pd.notnull(cantidad) and _legacy_is_parseable_date(fecha):
+            parsed = pd.to_datetime(fecha, errors="coerce", dayfirst=True)
+            if pd.isna(parsed):
+                continue
+            fecha_str = str(parsed.date())
+            fechas_dict[med].add(fecha_str)
+            fecha_archivo_dict[med].append(fecha_str)
+            cantidades_por_mes[med][parsed.strftime("%m")] += int(cantidad)
+
+    grouped = df.groupby(med_column)[cantidad_column].sum()
+    rows = []
+    for tipo, grupo in [("top", grouped.sort_values(ascending=False).head(10)),
+                        ("bottom", grouped.sort_values(ascending=True).head(10))]:
+        for medicamento, cantidad in grupo.items():
+            fechas_para_med = fecha_archivo_dict.get(medicamento.strip().upper(), [])
+            rows.append({
+                "archivo": os.path.basename(file_path),
+                "tipo": tipo,
+                "institucion": institucion,
+                "medicamento": medicamento,
+                "cantidad": int(cantidad),
+                "fecha_archivo": fechas_para_med[0] if fechas_para_med else "2000-01-01"
+            })
+    return rows
+
+# CSV ingestion before column pruning: every column, decoded by a Python text wrapper
+def legacy_read_csv(file_path):
+    with csv_loader.open_source(file_path) as raw, io.TextIOWrapper(raw, encoding=csv_loader.ENCODING) as f:
+        df = pd.read_csv(f, low_memory=False)
+    df.columns = [canonical_column(col) for col in df.columns]
+    return df
+
+# Per bundled prescription sheet, the old iterrows extraction against extract_file_summary,
+# both reading the raw .xls with a cold date cache, and whether their rows agree. Per bundled
+# CSV, the old whole-file read against csv_loader.read_gz_csv of the dataset's columns, with
+# tracemalloc peak and frame size.
+def bench_reference(repeat=3):
+    results = {}
+    with raw_reads():
+        for file_path, institucion in datasets.list_files("meds"):
+            def current():
+                clear_date_cache()
+                extract_meds_summary(file_path, institucion)
+
+            antes = time_call(legacy_meds_rows, file_path, institucion, repeat=repeat)
+            despues = time_call(current, repeat=repeat)
+            with contextlib.redirect_stdout(io.StringIO()):
+                iguales = legacy_meds_rows(file_path, institucion) == extract_meds_summary(file_path, institucion)["rows"]
+            results[file_path] = (antes, despues)
+            print(
+                f"⏱️ meds      {os.path.basename(file_path)}: {antes:.3f}s -> {despues:.3f}s ({antes / despues:.1f}x), "
+                f"{'✅ same rows' if iguales else '❌ rows differ'}"
+            )
+
+    for name in ("studies", "egresos"):
+        spec = datasets.get(name)
+        for file_path, _ in datasets.list_files(name):
+            def pruned(file_path):
+                return csv_loader.read_gz_csv(file_path, spec["columns"], categorical=spec["categorical"])
+
+            medidas = []
+            for load in (legacy_read_csv, pruned):
+                elapsed = time_call(load, file_path, repeat=repeat)
+                peak = peak_memory(load, file_path)
+                frame = load(file_path).memory_usage(deep=True).sum()
+                medidas.append((elapsed, peak, frame))
+            (antes, peak_antes, frame_antes), (despues, peak_despues, frame_despues) = medidas
+            results[file_path] = (antes, despues)
+            print(
+                f"⏱️ {name:<9} {csv_loader.source_name(file_path)}: {antes:.3f}s -> {despues:.3f}s, "
+                f"peak {peak_antes / 1e6:.1f} -> {peak_despues / 1e6:.1f} MB, "
+                f"frame {frame_antes / 1e6:.1f} -> {frame_despues / 1e6:.1f} MB"
+            )
+    clear_date_cache()
+    return results
+
+# ------------------ SYNTHETIC DATA ------------------
+
+BASELINE_FILE = os.environ.get("BENCH_BASELINE", "benchmark_baseline.json")
+
+# Slowdown (and extra peak memory) over the baseline reported as a regression; memory growth
+# under MEMORY_NOISE_MB is ignored
+TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", "0.2"))
+MEMORY_NOISE_MB = 5
+
+# Peak resident memory of this process in MB: since the last reset_peak_rss on Linux (VmHWM),
+# since the process started elsewhere (ru_maxrss, in KB on Linux and in bytes on macOS)
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return int(re.search(r"VmHWM:\s+(\d+)", f.read()).group(1)) / 1024
+    except OSError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 2**20 if sys.platform == "darwin" else maxrss / 1024
+
+# Resident memory of this process right now in MB (Linux only, 0 elsewhere)
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return int(re.search(r"VmRSS:\s+(\d+)", f.read()).group(1)) / 1024
+    except OSError:
+        return 0
+
+# Brings the peak RSS back down to the current RSS (Linux only), so peak_rss_mb only sees
+# what runs from now on and not the transient peak of importing pandas
+def reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+# Synthetic rows per file by default: enough that loading a CSV whole takes clearly more memory
+# than reading it in chunks (about 100 MB against 30 MB above the imports)
+SYNTHETIC_ROWS = 500000
+
+# Rows per chunk in the "chunked" cases, small enough that every synthetic file is read in
+# several chunks
+CHUNK_ROWS = 10000
+
+# One case, run in a fresh process so the peak memory and the in-process caches (dates,
+# schemas, aggregates) start clean. "extract" summarizes every file as the aggregate cache
+# does, loading each file whole; "chunked" does the same reading every CSV in chunks of
+# `chunk_rows` (as CSV_STREAM_MIN_MB=0 does); "fetch_all" runs the fetch function over a cold
+# aggregate cache. Returns (best seconds, MB the peak RSS of the runs rose above the RSS left
+# once pandas and the fetchers are imported), so the ~160 MB of interpreter and libraries every
+# case shares don't hide the difference between them.
+def _run_case(name, kind, download_dir, repeat, chunk_rows=CHUNK_ROWS):
+    if kind in ("extract", "chunked"):
+        csv_loader.STREAM_MIN_MB = 0 if kind == "chunked" else float("inf")
+        csv_loader.CHUNK_ROWS = chunk_rows
+        extract = datasets.fetcher(name).extract_file_summary
+        jobs = datasets.list_files(name, download_dir)
+
+        def run():
+            for file_path, institucion in jobs:
+                extract(file_path, institucion)
+    else:
+        fetch = datasets.fetch_function(name)
+
+        def run():
+            with cold_cache():
+                fetch(download_dir)
+
+    gc.collect()
+    reset_peak_rss()
+    antes = rss_mb()
+    seconds = time_call(run, repeat=repeat)
+    return seconds, peak_rss_mb() - antes
+
+# Monthly facts of a synthetic CSV file from one plain pandas groupby over the whole file,
+# without csv_loader, date_parsing or reduce_frames: the reference the fetchers' facts are
+# checked against. Synthetic files carry the canonical headers.
+def reference_facts(name, file_path):
+    spec = datasets.get(name)
+    df = pd.read_csv(file_path, encoding=csv_loader.ENCODING, usecols=spec["columns"])
+    fechas = pd.to_datetime(df[spec["date_column"]], dayfirst=True, errors="coerce")
+    anio_mes = fechas.dt.strftime("%Y-%m").fillna("")
+
+    if spec["value_column"] is None:
+        valores = pd.Series(1, index=df.index)
+    elif spec["aggregation"] == "sum":
+        valores = pd.to_numeric(df[spec["value_column"]], errors="coerce")
+    else:
+        valores = df[spec["value_column"]].notna().astype("int64")
+
+    hechos = {}
+    for fuente, columna in datasets.key_columns(spec):
+        hechos[fuente] = {}
+        for (nombre, mes), filas, cantidad in valores.groupby([df[columna], anio_mes]).agg(["size", "sum"]).itertuples(name=None):
+            hechos[fuente].setdefault(str(nombre), {})[mes] = [int(filas), int(cantidad)]
+    return hechos if isinstance(spec["key_columns"], dict) else hechos[None]
+
+# Files of CSV dataset `name` whose facts, read whole and in chunks of `chunk_rows`, differ
+# from reference_facts, as ["<file> (<mode>)"]
+def check_against_reference(name, download_dir, chunk_rows=CHUNK_ROWS):
+    csv_loader.CHUNK_ROWS = chunk_rows
+    extract = datasets.fetcher(name).extract_file_summary
+    differ = []
+    for file_path, institucion in datasets.list_files(name, download_dir):
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            reference = reference_facts(name, file_path)
+            for mode, min_mb in (("whole", float("inf")), ("chunked", 0)):
+                csv_loader.STREAM_MIN_MB = min_mb
+                if extract(file_path, institucion)["hechos"] != reference:
+                    differ.append(f"{os.path.basename(file_path)} ({mode})")
+    return differ
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_baseline(config, results, path=BASELINE_FILE):
+    baseline = load_baseline(path)
+    baseline[config] = results
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+    print(f"💾 Baseline saved for {config}: {path}")
+
+# Prints every case next to its baseline and returns the cases that got slower, or use more
+# memory, beyond the tolerance
+def compare_with_baseline(results, baseline, tolerance=TOLERANCE):
+    if not baseline:
+        print("ℹ️ No baseline for this configuration yet, save one with --save-baseline")
+        return []
+
+    regressions = []
+    for case, result in results.items():
+        before = baseline.get(case)
+        if not before:
+            continue
+
+        cambio = result["seconds"] / before["seconds"] - 1
+        slower = cambio > tolerance
+        more_memory = result["peak_mb"] > before["peak_mb"] * (1 + tolerance) + MEMORY_NOISE_MB
+        marca = "🐢 slower" if slower else "🧠 more memory" if more_memory else "✅"
+        print(
+            f"📊 {case:<17} {result['seconds']:.3f}s vs {before['seconds']:.3f}s ({cambio:+.0%}), "
+            f"peak {result['peak_mb']:.1f} vs {before['peak_mb']:.1f} MB {marca}"
+        )
+        if slower or more_memory:
+            regressions.append(case)
+    return regressions
+
+# Generates `files` synthetic files of `rows` rows per dataset in a temporary folder, times
+# extraction (whole and, for CSV datasets, chunked) and fetch_all_* on each dataset and
+# compares the results with the baseline stored for the same configuration (or stores them as
+# the baseline). CSV facts that differ from a plain pandas groupby over the whole file, read
+# whole or in chunks, count as a regression. Returns (results, regressed cases).
+def bench_synthetic(rows=SYNTHETIC_ROWS, cardinality=None, files=2, repeat=3, baseline_file=BASELINE_FILE, update_baseline=False,
+                    chunk_rows=CHUNK_ROWS):
+    config = f"rows={rows},cardinality={cardinality or 'default'},files={files}"
+    root = tempfile.mkdtemp(prefix="bench_data_")
+    results = {}
+    mismatches = []
+    try:
+        generated = synthetic_data.generate(root, rows, cardinality=cardinality, files=files)
+        spawn = multiprocessing.get_context("spawn")
+        for name, (download_dir, total_rows) in generated.items():
+            kinds = ["extract", "fetch_all"]
+            if datasets.get(name)["format"] != "xls":
+                kinds.insert(1, "chunked")
+
+            for kind in kinds:
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    seconds, peak = pool.submit(_run_case, name, kind, download_dir, repeat, chunk_rows).result()
+
+                case = f"{name}.{kind}"
+                results[case] = {
+                    "seconds": round(seconds, 4),
+                    "peak_mb": round(peak, 1),
+                    "rows": total_rows,
+                    "rows_per_sec": round(total_rows / seconds)
+                }
+                print(f"⏱️ {case:<17} {seconds:.3f}s, peak {peak:.1f} MB, {total_rows / seconds:,.0f} rows/s")
+
+            if "chunked" in kinds:
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    differ = pool.submit(check_against_reference, name, download_dir, chunk_rows).result()
+                if differ:
+                    print(f"❌ {name}: facts differ from a whole-file pandas groupby: {', '.join(differ)}")
+                    mismatches.append(f"{name}.facts")
+                else:
+                    print(f"✅ {name}: whole-file and chunked facts match a whole-file pandas groupby")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if update_baseline:
+        save_baseline(config, results, baseline_file)
+        return results, mismatches
+    return results, mismatches + compare_with_baseline(results, load_baseline(baseline_file).get(config))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the fetchers on the bundled files or on synthetic data")
+    parser.add_argument("targets", nargs="*", help="meds, studies, diagnosis, meds-payload, dates, reference, workers=<n,...> or synthetic")
+    parser.add_argument("--rows", type=int, default=SYNTHETIC_ROWS, help="synthetic rows per file")
+    parser.add_argument("--cardinality", type=int, help="distinct ranked names per synthetic dataset")
+    parser.add_argument("--files", type=int, default=2, help="synthetic files per dataset")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per synthetic case, the best one is kept")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per chunk in the chunked cases")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store the synthetic results as the baseline")
+    args = parser.parse_args()
+
+    targets = args.targets or ["meds", "studies", "diagnosis"]
+    for target in targets:
+        if target == "synthetic":
+            _, regressions = bench_synthetic(
+                args.rows, args.cardinality, args.files, args.repeat, args.baseline, args.save_baseline, args.chunk_rows
+            )
+            if regressions:
+                print(f"❌ Regressions: {', '.join(regressions)}")
+                sys.exit(1)
+            continue
+        if target.startswith("workers"):
+            # e.g. "workers=1,4"
+            counts = [int(n) for n in target.partition("=")[2].split(",") if n]
+            bench_workers(counts or None)
+            continue
+        {
+            "meds": bench_meds,
+            "studies": bench_studies,
+            "diagnosis": bench_diagnosis,
+            "meds-payload": bench_meds_payload,
+            "dates": bench_dates,
+            "reference": bench_reference
+        }[target]()
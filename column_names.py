@@ -0,0 +1,92 @@
+import difflib
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+
+# Normalized headers seen in the published files that differ from the name the fetchers use
+# (normalize_column only halves runs of spaces, so "CANTIDAD   PRESCRITA" ends up here)
+COLUMN_ALIASES = {
+    "CANTIDAD  PRESCRITA": "CANTIDAD PRESCRITA",
+    "FECHA EMISION": "FECHA DE EMISION",
+    "FECHA_DE_LA_CITA": "FECHA DE LA CITA",
+    "FECHA INGRESO": "FECHA_INGRESO",
+    "DESCRIPCION CIE 10": "DESCRIPCION_CIE_10",
+    "DESCRIPCION_CIE10": "DESCRIPCION_CIE_10",
+    "SERVICIO TRONCAL": "SERVICIO_TRONCAL"
+}
+
+# Distinct raw headers are few and repeat across files and requests, so normalizations are
+# memoized instead of re-running unicodedata for every column of every read
+@lru_cache(maxsize=4096)
+def _normalize(raw):
+    normalized = unicodedata.normalize("NFKD", raw)
+    clean = "".join(c for c in normalized if not unicodedata.combining(c))
+    return clean.upper().strip().replace("  ", " ")
+
+def normalize_column(col):
+    return _normalize(str(col))
+
+# Name the fetchers use for a raw header: normalized, then mapped through COLUMN_ALIASES
+def canonical_column(col):
+    normalized = normalize_column(col)
+    return COLUMN_ALIASES.get(normalized, normalized)
+
+# Maps each canonical column name to the position of its first raw header; memoized per header
+@lru_cache(maxsize=256)
+def _header_positions(header):
+    positions = {}
+    for i, raw in enumerate(header):
+        positions.setdefault(canonical_column(raw), i)
+    return positions
+
+def column_positions(header):
+    return dict(_header_positions(tuple(str(col) for col in header)))
+
+class SchemaError(ValueError):
+    pass
+
+# (source path, size, mtime) -> canonical column positions of that file's header, an LRU of
+# SCHEMA_CACHE_SIZE entries: every new version of a file adds a key, so it would otherwise
+# grow for as long as the server runs
+SCHEMA_CACHE_SIZE = int(os.environ.get("SCHEMA_CACHE_SIZE", "1024"))
+
+_schemas = OrderedDict()
+_schemas_lock = threading.Lock()
+
+# Canonical column positions of `file_path`, detected from its header row (read with
+# `read_header`, outside the lock) once per version of the file
+def detect_schema(file_path, read_header, source=None):
+    st = os.stat(source or file_path)
+    key = (file_path, st.st_size, st.st_mtime_ns)
+    with _schemas_lock:
+        if key in _schemas:
+            _schemas.move_to_end(key)
+            return _schemas[key]
+
+    schema = column_positions(read_header(file_path))
+    with _schemas_lock:
+        _schemas[key] = schema
+        while len(_schemas) > SCHEMA_CACHE_SIZE:
+            _schemas.popitem(last=False)
+    return schema
+
+# Raises SchemaError naming the missing columns, with close matches from the header, when the
+# file's schema lacks any of `required` -- before anything beyond the header is read
+def require_columns(file_path, schema, required):
+    missing = [col for col in required if col not in schema]
+    if not missing:
+        return schema
+
+    hints = []
+    for col in missing:
+        close = difflib.get_close_matches(col, list(schema), n=1, cutoff=0.6)
+        if close:
+            hints.append(f"{col!r} (found {close[0]!r}, add it to COLUMN_ALIASES?)")
+        else:
+            hints.append(repr(col))
+    raise SchemaError(
+        f"Unknown schema in {os.path.basename(file_path)}: missing {', '.join(hints)}; "
+        f"header has {', '.join(sorted(schema)) or 'no columns'}"
+    )
@@ -0,0 +1,122 @@
+import csv
+import gzip
+import io
+import os
+import zipfile
+from contextlib import contextmanager
+import pandas as pd
+from column_names import detect_schema, require_columns
+
+ENCODING = "latin1"
+
+# Sources can also be CSV members read straight out of a ZIP, addressed as "<zip path>::<member>"
+ZIP_MEMBER_SEPARATOR = "::"
+
+def zip_member_path(zip_path, member):
+    return f"{zip_path}{ZIP_MEMBER_SEPARATOR}{member}"
+
+# Returns (file on disk, member name or None)
+def split_source(file_path):
+    zip_path, _, member = file_path.partition(ZIP_MEMBER_SEPARATOR)
+    return zip_path, member or None
+
+def source_file(file_path):
+    return split_source(file_path)[0]
+
+# Name a source is recorded under in its folder: the file name, or "<zip name>::<member>" with
+# the member's full path inside the archive
+def source_key(file_path):
+    zip_path, member = split_source(file_path)
+    name = os.path.basename(zip_path)
+    return name if member is None else zip_member_path(name, member)
+
+# Name a source is reported under: the member's own name for ZIP members, like their .csv.gz
+# copies, and the file name otherwise
+def source_name(file_path):
+    zip_path, member = split_source(file_path)
+    return os.path.basename(member or zip_path)
+
+def is_zip_member(file_path):
+    return split_source(file_path)[1] is not None
+
+# Binary stream over the decompressed CSV bytes of a .csv.gz or a ZIP member
+@contextmanager
+def open_source(file_path):
+    zip_path, member = split_source(file_path)
+    if member is None:
+        with gzip.open(file_path, "rb") as f:
+            yield f
+        return
+
+    with zipfile.ZipFile(zip_path) as zip_ref, zip_ref.open(member) as f:
+        yield f
+
+def read_header(file_path):
+    with open_source(file_path) as raw:
+        f = io.TextIOWrapper(raw, encoding=ENCODING, newline="")
+        return next(csv.reader(f), [])
+
+# Canonical column positions of a .csv.gz or ZIP member, from its header row (read once per
+# version of the file)
+def csv_schema(file_path):
+    return detect_schema(file_path, read_header, source_file(file_path))
+
+# Key date formats are remembered under (see date_parsing.infer_format): the column layout of
+# the file's header
+def schema_key(file_path):
+    return tuple(sorted(csv_schema(file_path).items()))
+
+# Files above this many compressed MB are aggregated chunk by chunk instead of loaded whole
+# (0 streams every file); CSV_CHUNK_ROWS rows are read per chunk
+STREAM_MIN_MB = float(os.environ.get("CSV_STREAM_MIN_MB", "32"))
+CHUNK_ROWS = int(os.environ.get("CSV_CHUNK_ROWS", "100000"))
+
+# Compressed size of a .csv.gz or ZIP member
+def source_size(file_path):
+    zip_path, member = split_source(file_path)
+    if member is None:
+        return os.path.getsize(file_path)
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        return zip_ref.getinfo(member).compress_size
+
+def is_large_source(file_path):
+    return source_size(file_path) >= STREAM_MIN_MB * 1024 * 1024
+
+# (canonical names, read_csv keyword arguments) for the requested columns of a source
+def _read_options(file_path, columns, categorical, required):
+    positions = require_columns(file_path, csv_schema(file_path), required)
+    wanted = [(positions[col], col) for col in columns if col in positions]
+    wanted.sort()
+
+    usecols = [i for i, _ in wanted]
+    dtype = {i: "category" for i, col in wanted if col in categorical}
+    return [col for _, col in wanted], {"encoding": ENCODING, "usecols": usecols, "dtype": dtype}
+
+# Reads only the requested (canonical) columns of a .csv.gz (or ZIP member) and returns them
+# under their canonical names. Columns missing from the file are simply absent from the
+# result, unless they are `required`: then SchemaError is raised from the header alone,
+# before the data is read. The ones listed in `categorical` are loaded as pandas categoricals.
+def read_gz_csv(file_path, columns, categorical=(), required=()):
+    names, options = _read_options(file_path, columns, categorical, required)
+
+    if is_zip_member(file_path):
+        # Inflate the member straight out of the archive, no extracted copy needed
+        with open_source(file_path) as f:
+            df = pd.read_csv(f, **options)
+    else:
+        # Let pandas' C parser decompress and decode instead of a Python text wrapper
+        df = pd.read_csv(file_path, compression="gzip", **options)
+    df.columns = names
+    return df
+
+# Same columns as read_gz_csv, as frames of at most `chunksize` rows, so only one chunk is
+# in memory at a time
+def iter_gz_csv(file_path, columns, categorical=(), required=(), chunksize=None):
+    names, options = _read_options(file_path, columns, categorical, required)
+    options["chunksize"] = chunksize or CHUNK_ROWS
+
+    with open_source(file_path) as f:
+        with pd.read_csv(f, **options) as reader:
+            for chunk in reader:
+                chunk.columns = names
+                yield chunk
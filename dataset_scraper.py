@@ -0,0 +1,112 @@
+import os
+import re
+import zipfile
+from bs4 import BeautifulSoup
+import datasets
+from http_download import make_session, download_all, manifest_path, REQUEST_TIMEOUT
+from file_index import refresh as refresh_index
+from metadata_store import record_downloads
+from zip_ingest import ingest_zip
+
+DEFAULT_BASE_URL = "https://historico.datos.gob.mx"
+
+LINK_LABELS = {"xls": ".xls", "csv": ".csv", "zip": "ZIP"}
+
+def fetch_page(session, url):
+    response = session.get(url, timeout=REQUEST_TIMEOUT)
+    return BeautifulSoup(response.text, "html.parser")
+
+# Institution name from the dataset page's /organization/ link
+def find_institucion(soup):
+    org_link = soup.find("a", href=re.compile("/busca/organization/"))
+    return org_link.text.strip().upper() if org_link else "DESCONOCIDA"
+
+def find_links(soup, spec):
+    criteria = {"href": re.compile(spec["link_pattern"], re.I) if spec["link_pattern"] else True}
+    if spec["link_text"]:
+        criteria["string"] = re.compile(spec["link_text"], re.I)
+
+    links = soup.find_all("a", **criteria)
+    # Single-file datasets take the first matching link
+    return links[:1] if spec["filename"] else links
+
+# (url, file_path, on_saved) download tasks for the links, named after each link's title
+# unless the dataset has a fixed file name. CSVs are compressed on the fly while streaming,
+# so the plain .csv never touches disk.
+def build_tasks(links, spec, download_dir, base_url):
+    tasks = []
+    for i, link in enumerate(links):
+        file_url = link.get("href")
+        if not file_url.startswith("http"):
+            file_url = base_url + file_url
+
+        if spec["filename"]:
+            filename = spec["filename"]
+        else:
+            title = link.get("data-name") or link.text.strip() or f"archivo_{i}"
+            filename = title.replace(" ", "_").replace("/", "_") + "." + spec["format"]
+        file_path = os.path.join(download_dir, filename)
+        if spec["format"] == "csv":
+            file_path += ".gz"
+
+        tasks.append((file_url, file_path, None))
+    return tasks
+
+# Scrapes dataset `name` from its registry entry: finds the download links, downloads them
+# concurrently with conditional requests, records metadata, ingests ZIP members, stages the
+# files for the fetchers and refreshes the file listing index
+def run(name, download_dir=None, base_url=DEFAULT_BASE_URL, session=None, progress=None):
+    spec = datasets.get(name)
+    download_dir = download_dir or spec["download_dir"]
+    if not os.path.exists(download_dir):
+        os.makedirs(download_dir)
+
+    dataset_url = f"{base_url}/busca/dataset/{spec['slug']}"
+
+    print(f"🔍 Scraping: {dataset_url}")
+
+    session = session or make_session()
+    soup = fetch_page(session, dataset_url)
+
+    links = find_links(soup, spec)
+    label = LINK_LABELS[spec["format"]]
+    if not links:
+        print(f"❌ No {label} links found.")
+        return
+
+    print(f"📦 Found {len(links)} {label} file(s) to download")
+
+    institucion = find_institucion(soup)
+    print(f"🏥 Institution: {institucion}")
+
+    tasks = build_tasks(links, spec, download_dir, base_url)
+
+    # 🔁 Conditional requests: unchanged files cost a 304 instead of a re-download, interrupted
+    # ones are resumed
+    results = download_all(
+        session, tasks, compress=spec["format"] == "csv",
+        manifest_file=manifest_path(download_dir, spec["manifest"]), progress=progress
+    )
+
+    # 🗄️ Record institution, source and checksum of every file in one transaction
+    record_downloads(download_dir, tasks, results, institucion)
+
+    if spec["format"] == "zip":
+        for url, zip_path, _ in tasks:
+            if isinstance(results.get(url), Exception):
+                print(f"❌ Error downloading ZIP: {results[url]}")
+                return
+
+            # Only members that changed since the last run are re-compressed
+            try:
+                ingested = ingest_zip(zip_path, download_dir, institucion, source_url=url, manifest=spec["manifest"])
+                print(f"📂 Ingested {ingested} changed member(s) from: {zip_path}")
+            except (zipfile.BadZipFile, OSError) as e:
+                print(f"❌ Error reading ZIP: {e}")
+                return
+
+    # 📦 Convert the downloaded files once into columnar files for the fetchers
+    datasets.stage_all(name, download_dir)
+
+    # 🗂️ Update the file listing index with what was just written
+    refresh_index(download_dir)
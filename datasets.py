@@ -0,0 +1,355 @@
+import importlib
+import os
+import zipfile
+import pandas as pd
+from aggregate_cache import cached_results
+from aggregations import ranked_from_facts, reduce_frames
+import fact_store
+import metadata_store
+from csv_loader import (
+    csv_schema, is_large_source, is_zip_member, iter_gz_csv, read_gz_csv, read_header, schema_key, source_key,
+    source_name, zip_member_path
+)
+from date_parsing import parse_dates, report_unparsed
+from http_download import PARTIAL_SUFFIX
+from staging import is_staged, read_staged, write_staged
+
+# Every datos.gob.mx dataset the API serves, described once. The scrape engine
+# (dataset_scraper.py) and the fetch helpers below are driven by these entries. CSV datasets
+# are read, reduced and ranked by csv_summary from their entry alone, so their fetcher module
+# only formats the rows; the .xls prescriptions keep their own reader in fetch_meds.py, which
+# takes its columns from its entry.
+#
+#   slug            dataset page under <base_url>/busca/dataset/
+#   download_dir    folder the files are kept in
+#   manifest        name of the download manifest (.<manifest>.manifest.json)
+#   link_text       text the download links must carry, or None for any link
+#   link_pattern    regex their href must match, or None for any href
+#   format          "xls" (kept as is), "csv" (gzip-compressed while downloading) or "zip"
+#                   (a single archive whose CSV members are ingested)
+#   filename        fixed name for a single-file dataset; otherwise named after each link
+#   file_prefixes   lowercase prefixes of the data files in download_dir (None: any)
+#   columns         (canonical, see column_names.py) columns the fetcher reads
+#   required        columns a file must have; files without them fail on their header
+#   categorical     columns loaded as pandas categoricals
+#   key_columns     columns ranked top/bottom-N (fuente -> column for several rankings)
+#   value_column    column aggregated into each key's cantidad; None counts rows
+#   date_column     column the monthly series are built from
+#   aggregation     "sum" adds up value_column, "count" counts the rows where it is filled
+#   cache           aggregate_cache dataset name
+#   facts           fact_store dataset (one "<facts>.<fuente>" per key column when
+#                   key_columns is a dict)
+#   facts_field     key of the per-file summary holding its fact rows
+#   series_measure  fact measure the monthly histograms show ("filas" or "cantidad")
+#   fetcher         module with stage_file / extract_file_summary and the fetch function
+#                   (CSV datasets build both on stage_csv / csv_summary below)
+#   fetch           name of the fetch function in that module
+DATASETS = {
+    "meds": {
+        "slug": "recursos-materiales-recetas",
+        "download_dir": "Webscrapping",
+        "manifest": "recetas",
+        "link_text": "Descargar",
+        "link_pattern": r"\.xls$",
+        "format": "xls",
+        "filename": None,
+        "file_prefixes": None,
+        "columns": ["DESCRIPCION DEL MEDICAMENTO", "FECHA DE EMISION", "CANTIDAD PRESCRITA"],
+        "required": ["DESCRIPCION DEL MEDICAMENTO", "CANTIDAD PRESCRITA"],
+        "categorical": [],
+        "key_columns": ["DESCRIPCION DEL MEDICAMENTO"],
+        "value_column": "CANTIDAD PRESCRITA",
+        "date_column": "FECHA DE EMISION",
+        "aggregation": "sum",
+        "cache": "meds",
+        "facts": "meds",
+        "facts_field": "hechos",
+        "series_measure": "cantidad",
+        "fetcher": "fetch_meds",
+        "fetch": "fetch_all_prescriptions"
+    },
+    "studies": {
+        "slug": "estudios-otorgados-de-analisis-clinicos",
+        "download_dir": "Webscrapping",
+        "manifest": "estudios",
+        "link_text": None,
+        "link_pattern": r"\.csv$",
+        "format": "csv",
+        "filename": None,
+        "file_prefixes": [
+            "estudios_otorgadas_de_laboratorio_de_análisis_clínicos_del_",
+            "estudios_otorgados_de_laboratorio_de_análisis_clínicos_del_"
+        ],
+        "columns": ["FECHA DE LA CITA", "SERVICIO", "ESTUDIO"],
+        "required": ["FECHA DE LA CITA", "SERVICIO", "ESTUDIO"],
+        "categorical": ["SERVICIO", "ESTUDIO"],
+        "key_columns": ["ESTUDIO"],
+        "value_column": "SERVICIO",
+        "date_column": "FECHA DE LA CITA",
+        "aggregation": "count",
+        "cache": "studies",
+        "facts": "studies",
+        "facts_field": "hechos",
+        "series_measure": "filas",
+        "fetcher": "fetch_studies",
+        "fetch": "fetch_all_studies"
+    },
+    "egresos": {
+        "slug": "datos-de-egresos-hospitalarios",
+        "download_dir": "Webscrapping_ISSSTE",
+        "manifest": "egresos",
+        "link_text": "Descargar",
+        "link_pattern": None,
+        "format": "zip",
+        "filename": "egresos_hospitalarios.zip",
+        "file_prefixes": ["egresos"],
+        "columns": ["FECHA_INGRESO", "DESCRIPCION_CIE_10", "SERVICIO_TRONCAL"],
+        "required": ["FECHA_INGRESO"],
+        "categorical": ["DESCRIPCION_CIE_10", "SERVICIO_TRONCAL"],
+        "key_columns": {"diagnostico": "DESCRIPCION_CIE_10", "especialidad": "SERVICIO_TRONCAL"},
+        "value_column": None,
+        "date_column": "FECHA_INGRESO",
+        "aggregation": "count",
+        "cache": "diagnosis_specialities",
+        "facts": "egresos",
+        "facts_field": "hechos",
+        "series_measure": "filas",
+        "fetcher": "fetch_diagnosis_specialities",
+        "fetch": "fetch_all_diagnosis_and_specialities"
+    }
+}
+
+def get(name):
+    if name not in DATASETS:
+        raise KeyError(f"Unknown dataset: {name}")
+    return DATASETS[name]
+
+# The fetcher module of a dataset, imported on first use (fetchers import this module)
+def fetcher(name):
+    return importlib.import_module(get(name)["fetcher"])
+
+def fetch_function(name):
+    return getattr(fetcher(name), get(name)["fetch"])
+
+# (fact_store dataset, function picking its fact rows out of a per-file summary) pairs: one
+# per fuente when the dataset ranks several columns
+def fact_targets(name):
+    spec = get(name)
+    field = spec["facts_field"]
+    if isinstance(spec["key_columns"], dict):
+        return [
+            (f"{spec['facts']}.{fuente}", lambda summary, fuente=fuente: summary[field].get(fuente, {}))
+            for fuente in spec["key_columns"]
+        ]
+    return [(spec["facts"], lambda summary: summary[field])]
+
+# fact_store datasets of `name`, e.g. ["egresos.diagnostico", "egresos.especialidad"]
+def store_datasets(name):
+    return [store for store, _ in fact_targets(name)]
+
+# {fact_store dataset: registry name} over the whole registry
+def store_owners():
+    return {store: name for name in DATASETS for store in store_datasets(name)}
+
+def _is_data_file(spec, file):
+    file_lower = file.lower()
+    # Manifests, the metadata store and in-progress downloads
+    if file.startswith(".") or file.endswith(PARTIAL_SUFFIX):
+        return False
+    if spec["file_prefixes"] and not any(file_lower.startswith(prefix) for prefix in spec["file_prefixes"]):
+        return False
+    suffix = ".xls" if spec["format"] == "xls" else ".csv.gz"
+    return file_lower.endswith(suffix)
+
+# Registry name of the dataset a file of a download folder belongs to: one of its data files,
+# or the archive a ZIP dataset downloads. None for anything else.
+def dataset_of(file):
+    for name, spec in DATASETS.items():
+        if _is_data_file(spec, file) or (spec["format"] == "zip" and file == spec["filename"]):
+            return name
+    return None
+
+# (fuente, column) of every ranked key column; fuente is None for a plain list of keys
+def key_columns(spec):
+    if isinstance(spec["key_columns"], dict):
+        return list(spec["key_columns"].items())
+    return [(None, columna) for columna in spec["key_columns"]]
+
+# Per-row values the entry's value_column adds to cantidad, or None to count rows
+def row_values(spec, df):
+    columna = spec["value_column"]
+    if columna is None:
+        return None
+    if spec["aggregation"] == "sum":
+        return pd.to_numeric(df[columna], errors="coerce")
+    return df[columna].notna().astype("int64")
+
+# CSV members of the dataset's ZIPs that have no .csv.gz copy next to the archive (the scraper
+# keeps copies in sync with the members, or removes them when EGRESOS_STORAGE=zip)
+def list_zip_members(spec, download_dir, files):
+    sources = []
+    for file in files:
+        file_lower = file.lower()
+        if not file_lower.endswith(".zip"):
+            continue
+        if spec["file_prefixes"] and not any(file_lower.startswith(prefix) for prefix in spec["file_prefixes"]):
+            continue
+
+        zip_path = os.path.join(download_dir, file)
+        try:
+            with zipfile.ZipFile(zip_path) as zip_ref:
+                members = [i.filename for i in zip_ref.infolist() if i.filename.lower().endswith(".csv")]
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"⚠️ Skipping unreadable ZIP {zip_path}: {e}")
+            continue
+
+        for member in members:
+            copia = os.path.join(download_dir, os.path.basename(member) + ".gz")
+            if os.path.exists(copia):
+                continue
+            sources.append((file, zip_member_path(zip_path, member)))
+
+    return sources
+
+# [(file_path, institucion)] for the data files of dataset `name` in `download_dir`
+def list_files(name, download_dir=None):
+    spec = get(name)
+    download_dir = download_dir or spec["download_dir"]
+    files = sorted(os.listdir(download_dir))
+
+    # (archive, source) -- a ZIP member recorded before its own entry existed takes its archive's
+    # institution
+    sources = [(None, os.path.join(download_dir, file)) for file in files if _is_data_file(spec, file)]
+    if spec["format"] == "zip":
+        sources += list_zip_members(spec, download_dir, files)
+
+    # 🗄️ One metadata query for the whole folder, keyed like metadata_store.locate
+    names = [source_key(file_path) for _, file_path in sources] + [archive for archive, _ in sources if archive]
+    instituciones = metadata_store.institutions(download_dir, names)
+    result = []
+    for archive, file_path in sources:
+        institucion = instituciones.get(source_key(file_path))
+        if institucion is None:
+            institucion = instituciones.get(archive, "Desconocida")
+        result.append((file_path, institucion))
+    return result
+
+def stage_all(name, download_dir=None):
+    stage_file = fetcher(name).stage_file
+    for file_path, institucion in list_files(name, download_dir):
+        if not is_staged(file_path):
+            stage_file(file_path, institucion)
+
+# Per-file summaries of every data file of dataset `name`, through the aggregate cache (only
+# new or changed files are extracted, in parallel with workers > 1), with the fact rows and
+# ranked rows of new or changed files loaded into the fact store
+def aggregate(name, download_dir=None, workers=None):
+    spec = get(name)
+    download_dir = download_dir or spec["download_dir"]
+    if not os.path.exists(download_dir):
+        raise FileNotFoundError("Webscrapping folder not found")
+
+    jobs = list_files(name, download_dir)
+    summaries = cached_results(
+        spec["cache"], jobs, fetcher(name).extract_file_summary, workers=workers, folder=download_dir
+    )
+
+    # 🧮 Load new or changed files into the fact store the routes query
+    fact_store.sync(name, jobs, summaries, fact_targets(name), folder=download_dir)
+
+    return summaries
+
+# ------------------ CSV DATASETS ------------------
+
+# Key the format of a file's date column is remembered under: the column and the file's layout
+def date_schema(name, file_path):
+    return (get(name)["date_column"], schema_key(file_path))
+
+def load_frame(name, file_path):
+    spec = get(name)
+    df = read_staged(file_path)
+    if df is None:
+        df = read_gz_csv(file_path, spec["columns"], categorical=spec["categorical"], required=spec["required"])
+    return df
+
+# Stages a file of CSV dataset `name` and records its metadata. Staged copies also keep the
+# date column as a categorical, since it only has a few hundred distinct values.
+def stage_csv(name, file_path, institucion):
+    spec = get(name)
+    try:
+        df = read_gz_csv(file_path, spec["columns"], categorical=spec["columns"], required=spec["required"])
+        header = read_header(file_path)
+    except Exception as e:
+        print(f"❌ Failed to read {file_path}: {e}")
+        return None
+
+    fecha_min = fecha_max = None
+    if spec["date_column"] in df.columns:
+        fechas = parse_dates(df[spec["date_column"]], dayfirst=True, schema=date_schema(name, file_path))
+        fecha_min, fecha_max = metadata_store.date_range(fechas)
+
+    metadata_store.record(
+        file_path, rows=len(df), fecha_min=fecha_min, fecha_max=fecha_max,
+        schema_fingerprint=metadata_store.schema_fingerprint(header)
+    )
+    return write_staged(file_path, df, institucion)
+
+# Per-file summary of CSV dataset `name`: the file (its staged copy, or the raw CSV chunk by
+# chunk when it is large) reduced to the monthly facts of every key column, with the entry's
+# value_column and aggregation giving cantidad, and its top/bottom rows ranked from those
+# facts (by cantidad, or by rows without a value column). `fila(archivo, institucion,
+# fecha_archivo, fuente, tipo, nombre, cantidad, fechas_recetadas)` builds each row.
+def csv_summary(name, file_path, institucion, fila):
+    spec = get(name)
+    vacio = {"rows": [], "hechos": {}}
+    if not (file_path.endswith(".csv.gz") or is_zip_member(file_path)):
+        print(f"⏭️ Unsupported file type: {file_path}")
+        return vacio
+
+    try:
+        if is_large_source(file_path) and not is_staged(file_path):
+            columnas = csv_schema(file_path)
+            frames = iter_gz_csv(file_path, spec["columns"], categorical=spec["categorical"], required=spec["required"])
+        else:
+            df = load_frame(name, file_path)
+            columnas = df.columns
+            frames = [df]
+
+        for columna in (spec["date_column"], spec["value_column"]):
+            if columna is not None and columna not in columnas:
+                print(f"⚠️ Missing column: {columna} in {file_path}")
+                return vacio
+
+        claves = []
+        for fuente, columna in key_columns(spec):
+            if columna in columnas:
+                claves.append((fuente, columna))
+            else:
+                print(f"⚠️ Missing column: {columna} in {file_path}")
+
+        primera, hechos, no_parseadas = reduce_frames(
+            frames, claves, spec["date_column"], lambda frame: row_values(spec, frame),
+            schema=date_schema(name, file_path)
+        )
+    except Exception as e:
+        print(f"❌ Failed to read {file_path}: {e}")
+        return vacio
+
+    report_unparsed(file_path, spec["date_column"], no_parseadas)
+
+    fecha_archivo = "2000-01-01"
+    if not pd.isna(primera):
+        fecha_archivo = f"{primera.year}-01-01"
+
+    # ZIP members are reported under the member's own name, like their .csv.gz copies
+    archivo = source_name(file_path)
+    medida = "filas" if spec["value_column"] is None else "cantidad"
+    rows = [
+        fila(archivo, institucion, fecha_archivo, fuente, tipo, nombre, cantidad, fechas_recetadas)
+        for fuente, _ in claves
+        for tipo, nombre, cantidad, fechas_recetadas in ranked_from_facts(hechos[fuente], medida)
+    ]
+
+    if not isinstance(spec["key_columns"], dict):
+        hechos = hechos.get(None, {})
+    return {"rows": rows, "hechos": hechos}
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Date columns repeat a few hundred distinct strings over hundreds of thousands of rows, and
+# the same days show up again in every file of a dataset: each distinct value is parsed once
+# and kept in an LRU of DATE_CACHE_SIZE entries shared by all fetchers
+CACHE_SIZE = int(os.environ.get("DATE_CACHE_SIZE", "100000"))
+
+# Formats for parse_dates: None infers one from the column's first value, as pandas does for
+# a whole column ("mixed" when it cannot, parsing value by value); PER_VALUE parses every
+# value on its own, as a scalar pd.to_datetime would
+MIXED = "mixed"
+PER_VALUE = "per-value"
+
+_values = OrderedDict()
+_lock = threading.Lock()
+
+# schema key -> format inferred for it
+_formats = {}
+
+def _matches(valor, formato):
+    try:
+        return pd.notna(pd.to_datetime([valor], format=formato, errors="raise")[0])
+    except (ValueError, TypeError):
+        return False
+
+# Format of a column whose first non-null value is `primera`. With a `schema` key (e.g. the
+# file's column layout) the format is remembered and reused for files with the same layout as
+# long as it still reads their first value.
+def infer_format(primera, dayfirst=False, schema=None):
+    if not isinstance(primera, str):
+        return MIXED
+
+    formato = _formats.get(schema)
+    if formato is None or formato == MIXED or not _matches(primera, formato):
+        formato = guess_datetime_format(primera, dayfirst=dayfirst) or MIXED
+        if schema is not None:
+            _formats[schema] = formato
+    return formato
+
+def _parse_missing(valores, formato, dayfirst):
+    if formato == PER_VALUE:
+        return [pd.to_datetime(valor, errors="coerce", dayfirst=dayfirst) for valor in valores]
+    return list(pd.to_datetime(pd.Index(valores, dtype=object), format=formato, errors="coerce", dayfirst=dayfirst))
+
+# Parsed Timestamp (or NaT) of every value in `valores`, from the cache where possible. The
+# lock only guards the LRU; values missing from it are parsed outside, so threads parsing
+# different files don't wait on each other (two of them may parse the same value, same result).
+def _lookup(valores, formato, dayfirst):
+    found = {}
+    with _lock:
+        for valor in valores:
+            key = (formato, dayfirst, valor)
+            if key in _values:
+                _values.move_to_end(key)
+                found[valor] = _values[key]
+
+    missing = [valor for valor in valores if valor not in found]
+    if missing:
+        found.update(zip(missing, _parse_missing(missing, formato, dayfirst)))
+        with _lock:
+            for valor in missing:
+                _values[(formato, dayfirst, valor)] = found[valor]
+            while len(_values) > CACHE_SIZE:
+                _values.popitem(last=False)
+    return [found[valor] for valor in valores]
+
+# Parses a date column through its distinct values only; NaT where a value is missing or
+# unusable. Gives the same dates as pd.to_datetime(fechas, errors="coerce", dayfirst=...)
+# over the whole column (or, with formato=PER_VALUE, over each value on its own).
+def parse_dates(fechas, dayfirst=False, formato=None, schema=None):
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas
+
+    # One hashing pass: codes per row (-1 where missing) and distinct values in order of
+    # appearance, so the first one is the column's first value
+    codigos, unicas = pd.factorize(fechas)
+    if len(unicas) == 0:
+        return pd.Series(pd.NaT, index=fechas.index, dtype="datetime64[ns]")
+    unicas = list(unicas)
+    if formato is None:
+        formato = infer_format(unicas[0], dayfirst=dayfirst, schema=schema)
+
+    parseadas = pd.DatetimeIndex(_lookup(unicas, formato, dayfirst))
+    return pd.Series(parseadas.take(codigos, allow_fill=True, fill_value=pd.NaT), index=fechas.index)
+
+# {value: rows} of the values of `fechas` that are present but did not parse, optionally
+# only over the rows in `mask`
+def unparsed_values(fechas, parsed, mask=None):
+    bad = fechas.notna() & parsed.isna()
+    if mask is not None:
+        bad &= mask
+    if not bad.any():
+        return {}
+    return fechas[bad].astype(str).value_counts(sort=False).to_dict()
+
+# One line per file and column instead of one per bad row
+def report_unparsed(file_path, columna, conteos, ejemplos=5):
+    if not conteos:
+        return
+    valores = sorted(conteos, key=conteos.get, reverse=True)
+    muestra = ", ".join(repr(valor) for valor in valores[:ejemplos])
+    print(
+        f"⚠️ {sum(conteos.values())} row(s) with unparseable {columna} in {os.path.basename(file_path)}: "
+        f"{len(valores)} distinct value(s), e.g. {muestra}"
+    )
@@ -0,0 +1,304 @@
+import heapq
+import json
+import os
+import re
+import sqlite3
+from contextlib import closing
+from operator import itemgetter
+
+import aggregate_cache
+from csv_loader import source_file, source_name
+
+# Embedded analytical store every data route reads from. `facts` holds one row per file,
+# item and year-month with two measures: filas (source rows) and cantidad (quantity
+# prescribed for meds, rows with a SERVICIO for studies, rows for egresos). Rows without a
+# usable date keep NULL anio/mes. `ranked` holds the per-file top/bottom rows the fetch routes
+# return. Both are loaded from the cached per-file summaries, one file at a time: a changed
+# file only replaces its own rows. `files.version` is the aggregate_cache.CACHE_VERSION the
+# rows were built with, so bumping it reloads every file.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    dataset TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    orden INTEGER NOT NULL,
+    size INTEGER,
+    mtime INTEGER,
+    institucion TEXT,
+    version INTEGER,
+    PRIMARY KEY (dataset, file_path)
+);
+CREATE TABLE IF NOT EXISTS facts (
+    dataset TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    archivo TEXT NOT NULL,
+    institucion TEXT NOT NULL,
+    item TEXT NOT NULL,
+    anio INTEGER,
+    mes INTEGER,
+    filas INTEGER NOT NULL,
+    cantidad INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS facts_by_file ON facts (dataset, file_path);
+CREATE INDEX IF NOT EXISTS facts_by_item ON facts (dataset, item);
+CREATE INDEX IF NOT EXISTS facts_by_institucion ON facts (dataset, institucion);
+CREATE INDEX IF NOT EXISTS facts_by_fecha ON facts (dataset, anio, mes);
+CREATE TABLE IF NOT EXISTS ranked (
+    dataset TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    orden INTEGER NOT NULL,
+    archivo TEXT,
+    tipo TEXT,
+    institucion TEXT,
+    anio INTEGER,
+    fila TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ranked_by_file ON ranked (dataset, file_path);
+"""
+
+MAX_N = 1000
+
+MEDIDAS = ["filas", "cantidad"]
+
+# ?group_by= dimensions of the aggregation endpoint and the SQL that buckets them
+DIMENSIONS = {
+    "item": "item",
+    "institucion": "institucion",
+    "archivo": "archivo",
+    "anio": "anio",
+    "mes": "mes",
+    "trimestre": "CASE WHEN anio IS NULL THEN NULL ELSE printf('%04d-T%d', anio, (mes + 2) / 3) END",
+    "anio_mes": "CASE WHEN anio IS NULL THEN NULL ELSE printf('%04d-%02d', anio, mes) END"
+}
+
+ANIO_MES_PATTERN = re.compile(r"^(\d{4})-(\d{2})$")
+
+def db_path():
+    return os.environ.get("FACT_DB") or os.path.join(aggregate_cache.CACHE_DIR, "facts.sqlite")
+
+# Filters compare like api_responses.matches: trimmed and upper-cased with Python's rules,
+# which (unlike SQLite's UPPER) also cover accented names
+def _norm(value):
+    return None if value is None else str(value).strip().upper()
+
+def connect():
+    path = db_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    # Stores created before files.version: every file reloads once
+    if "version" not in {row[1] for row in conn.execute("PRAGMA table_info(files)")}:
+        conn.execute("ALTER TABLE files ADD COLUMN version INTEGER")
+    conn.create_function("norm", 1, _norm, deterministic=True)
+    return conn
+
+def folder_of(file_path):
+    return os.path.abspath(os.path.dirname(source_file(file_path)) or ".")
+
+def _anio_archivo(row):
+    try:
+        return int(str(row.get("fecha_archivo", "0000"))[:4])
+    except ValueError:
+        return None
+
+def _delete_file(conn, dataset, stores, file_path):
+    conn.executemany("DELETE FROM facts WHERE dataset = ? AND file_path = ?", [(store, file_path) for store in stores])
+    conn.execute("DELETE FROM ranked WHERE dataset = ? AND file_path = ?", (dataset, file_path))
+
+# Brings registry dataset `dataset` in line with a fetch: jobs are (file_path, institucion),
+# summaries[i] the cached summary of jobs[i] and targets the (facts dataset, function picking
+# its {item: {"YYYY-MM": [filas, cantidad]}} out of a summary) pairs. Files whose size, mtime,
+# institution and cache version did not change are left alone. `jobs` is the listing of
+# `folder`: files of that folder it no longer holds are dropped (e.g. a ZIP member replaced by
+# its .csv.gz copy), as are files elsewhere that no longer exist.
+def sync(dataset, jobs, summaries, targets, folder=None):
+    stores = [store for store, _ in targets]
+    listed = None if folder is None else os.path.abspath(folder)
+    with closing(connect()) as conn, conn:
+        known = {
+            row[0]: tuple(row[1:])
+            for row in conn.execute(
+                "SELECT file_path, size, mtime, institucion, version, orden, folder FROM files WHERE dataset = ?",
+                (dataset,)
+            )
+        }
+
+        folded = 0
+        for orden, ((file_path, institucion), summary) in enumerate(zip(jobs, summaries)):
+            signature = aggregate_cache.file_signature(file_path, institucion)
+            current = (signature["size"], signature["mtime"], institucion, aggregate_cache.CACHE_VERSION)
+            if known.get(file_path, ())[:4] == current:
+                # Files keep the order of the listing, which shifts as files come and go
+                if known[file_path][4] != orden:
+                    conn.execute("UPDATE files SET orden = ? WHERE dataset = ? AND file_path = ?", (orden, dataset, file_path))
+                continue
+
+            folder = folder_of(file_path)
+            archivo = source_name(file_path)
+            _delete_file(conn, dataset, stores, file_path)
+            for store, facts_of in targets:
+                conn.executemany(
+                    "INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            store, file_path, folder, archivo, institucion, item,
+                            int(anio_mes[:4]) if anio_mes else None, int(anio_mes[5:7]) if anio_mes else None,
+                            filas, cantidad
+                        )
+                        for item, meses in facts_of(summary).items()
+                        for anio_mes, (filas, cantidad) in meses.items()
+                    ]
+                )
+            conn.executemany(
+                "INSERT INTO ranked VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        dataset, file_path, folder, i, row.get("archivo"), row.get("tipo"), row.get("institucion"),
+                        _anio_archivo(row), json.dumps(row, ensure_ascii=False)
+                    )
+                    for i, row in enumerate(summary["rows"])
+                ]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO files (dataset, file_path, folder, orden, size, mtime, institucion, version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (dataset, file_path, folder, orden, *current)
+            )
+            folded += 1
+
+        listing = {file_path for file_path, _ in jobs}
+        gone = [
+            file_path for file_path, row in known.items()
+            if file_path not in listing and (row[5] == listed or not os.path.exists(source_file(file_path)))
+        ]
+        for file_path in gone:
+            _delete_file(conn, dataset, stores, file_path)
+            conn.execute("DELETE FROM files WHERE dataset = ? AND file_path = ?", (dataset, file_path))
+
+    if folded or gone:
+        print(f"🧮 Fact store {dataset}: loaded {folded} file(s), dropped {len(gone)}")
+
+def _in(expression, values, params):
+    if not values:
+        return ""
+    params.extend(sorted(values))
+    return f" AND {expression} IN ({', '.join('?' * len(values))})"
+
+def _scope(folder, params, column="folder"):
+    if folder is None:
+        return ""
+    params.append(os.path.abspath(folder))
+    return f" AND {column} = ?"
+
+# The per-file top/bottom rows of registry dataset `dataset`, in listing order, with the
+# ?institucion= / ?tipo= / ?archivo= / ?year= options of api_responses applied in SQL, and
+# only the rows of one `fuente` when given. A generator: rows are decoded as they are read and
+# the connection stays open until it is exhausted or closed.
+def ranked_rows(dataset, options, folder=None, fuente=None):
+    filters = options["filters"]
+    params = [dataset]
+    sql = (
+        "SELECT r.fila FROM ranked r JOIN files f ON f.dataset = r.dataset AND f.file_path = r.file_path "
+        "WHERE r.dataset = ?"
+    )
+    sql += _scope(folder, params, "r.folder")
+    sql += _in("norm(r.institucion)", filters.get("institucion"), params)
+    sql += _in("norm(r.tipo)", filters.get("tipo"), params)
+    sql += _in("norm(r.archivo)", filters.get("archivo"), params)
+    sql += _in("r.anio", options["years"], params)
+    if fuente is not None:
+        sql += " AND json_extract(r.fila, '$.fuente') = ?"
+        params.append(fuente)
+    sql += " ORDER BY f.orden, r.orden"
+
+    with closing(connect()) as conn:
+        for row in conn.execute(sql, params):
+            yield json.loads(row[0])
+
+# {item: {"YYYY-MM": total}} of `medida` over every file of facts dataset `dataset`, or
+# {(archivo, item): {...}} per file with por_archivo=True. `years` limits the months returned;
+# `instituciones` / `archivos` (upper-cased) the files they are summed over.
+def monthly_totals(dataset, years=None, por_archivo=False, medida="filas", folder=None, instituciones=None, archivos=None):
+    keys = "archivo, item" if por_archivo else "item"
+    params = [dataset]
+    sql = f"SELECT {keys}, anio, mes, SUM({medida}) FROM facts WHERE dataset = ? AND anio IS NOT NULL"
+    sql += _scope(folder, params)
+    sql += _in("anio", years, params)
+    sql += _in("norm(institucion)", instituciones, params)
+    sql += _in("norm(archivo)", archivos, params)
+    sql += f" GROUP BY {keys}, anio, mes"
+
+    totals = {}
+    with closing(connect()) as conn:
+        for row in conn.execute(sql, params):
+            key = (row[0], row[1]) if por_archivo else row[0]
+            totals.setdefault(key, {})[f"{row[-3]:04d}-{row[-2]:02d}"] = row[-1]
+    return totals
+
+# [("top", [(item, total)...]), ("bottom", [...])] of cantidad summed over every file, picked
+# with a heap from the merged per-item totals. Ties keep item order.
+def top_bottom_k(dataset, n=10, years=None, instituciones=None, archivos=None, folder=None):
+    params = [dataset]
+    sql = "SELECT item, SUM(cantidad) FROM facts WHERE dataset = ?"
+    sql += _scope(folder, params)
+    sql += _in("anio", years, params)
+    sql += _in("norm(institucion)", instituciones, params)
+    sql += _in("norm(archivo)", archivos, params)
+    sql += " GROUP BY item ORDER BY item"
+
+    with closing(connect()) as conn:
+        totals = conn.execute(sql, params).fetchall()
+
+    return [
+        ("top", heapq.nlargest(n, totals, key=itemgetter(1))),
+        ("bottom", heapq.nsmallest(n, totals, key=itemgetter(1)))
+    ]
+
+def _anio_mes(value, name):
+    match = ANIO_MES_PATTERN.match(value or "")
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"{name} must be a year-month, e.g. {name}=2023-01")
+    return int(match.group(1)) * 100 + int(match.group(2))
+
+# Parameterized aggregation over facts dataset `dataset`: the total of `medida` per
+# combination of the `group_by` dimensions, as [{dimension: value, ..., "total": n}].
+# `filters` maps item / institucion / archivo to upper-cased values; `desde` / `hasta` bound
+# the year-month ("YYYY-MM", inclusive); `orden` is "asc" / "desc" by total, or None for
+# dimension order. Raises ValueError with a message for the client on bad input.
+def query(dataset, group_by, medida="cantidad", filters=None, years=None, desde=None, hasta=None, orden=None, folder=None):
+    unknown = [dim for dim in group_by if dim not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown group_by dimension(s): {', '.join(unknown)}; use {', '.join(DIMENSIONS)}")
+    if medida not in MEDIDAS:
+        raise ValueError(f"medida must be one of {', '.join(MEDIDAS)}")
+    if orden not in (None, "asc", "desc"):
+        raise ValueError("orden must be asc or desc")
+
+    filters = filters or {}
+    params = []
+    columns = [f"{DIMENSIONS[dim]} AS {dim}" for dim in group_by]
+    sql = f"SELECT {', '.join(columns + [f'SUM({medida}) AS total'])} FROM facts WHERE dataset = ?"
+    params.append(dataset)
+    sql += _scope(folder, params)
+    sql += _in("norm(item)", filters.get("item"), params)
+    sql += _in("norm(institucion)", filters.get("institucion"), params)
+    sql += _in("norm(archivo)", filters.get("archivo"), params)
+    sql += _in("anio", years, params)
+    if desde:
+        sql += " AND anio * 100 + mes >= ?"
+        params.append(_anio_mes(desde, "desde"))
+    if hasta:
+        sql += " AND anio * 100 + mes <= ?"
+        params.append(_anio_mes(hasta, "hasta"))
+
+    if group_by:
+        sql += f" GROUP BY {', '.join(group_by)}"
+        order = [f"total {orden.upper()}"] if orden else []
+        sql += f" ORDER BY {', '.join(order + list(group_by))}"
+
+    with closing(connect()) as conn:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute(sql, params) if row["total"] is not None]
@@ -1,78 +1,181 @@
 import os
 import pandas as pd
-import unicodedata
+import xlrd
 import json
 import re
 from collections import defaultdict
+from aggregations import fold_months, monthly_facts, top_bottom
+import datasets
+from date_parsing import PER_VALUE, parse_dates, report_unparsed, unparsed_values
+import metadata_store
+from column_names import canonical_column, detect_schema, require_columns
+from staging import read_staged, write_staged
+
+DATASET = datasets.get("meds")
+COLUMNS = DATASET["columns"]
+REQUIRED_COLUMNS = DATASET["required"]
+MED_COLUMN = DATASET["key_columns"][0]
+FECHA_COLUMN = DATASET["date_column"]
+CANTIDAD_COLUMN = DATASET["value_column"]
+
+# The sheets carry a title block above the header row
+HEADER_ROW = 3
+
+def to_int_cantidades(cantidades, meds, fechas):
+    if pd.api.types.is_integer_dtype(cantidades):
+        return cantidades.astype("int64")
+
+    converted = {}
+    for cantidad in pd.unique(cantidades):
+        try:
+            converted[cantidad] = int(cantidad)
+        except Exception:
+            converted[cantidad] = None
+
+    result = cantidades.map(converted)
+    invalid = result.isna()
+    for med, fecha, cantidad in zip(meds[invalid], fechas[invalid], cantidades[invalid]):
+        print(f"❌ Unexpected parsing crash for {med} — {fecha}: invalid quantity {cantidad!r}")
+    return result
+
+def extract_file_summary(file_path, institucion):
+    fechas_dict = defaultdict(set)
+    cantidades_por_mes = defaultdict(lambda: defaultdict(int))
+    hechos = {}
+    rows = extract_from_file(file_path, institucion, fechas_dict, cantidades_por_mes, hechos)
+
+    # Plain dicts/lists so the per-file result can be cached as JSON and merged later.
+    # Quantities are kept per "YYYY-MM" so years stay apart, and "hechos" holds the file's
+    # rows for the fact store.
+    return {
+        "rows": rows,
+        "fechas": {med: sorted(fechas) for med, fechas in fechas_dict.items()},
+        "cantidades_por_mes": {med: dict(meses) for med, meses in cantidades_por_mes.items()},
+        "hechos": hechos
+    }
 
-def is_parseable_date(fecha):
+# cantidades_por_mes stays keyed by "%m" (all years together), as the API always returned it
+def merge_file_summary(summary, all_data, fechas_dict, cantidades_por_mes):
+    all_data.extend(summary["rows"])
+    for med, fechas in summary["fechas"].items():
+        fechas_dict[med].update(fechas)
+    for med, meses in summary["cantidades_por_mes"].items():
+        for mes, cantidad in fold_months(meses).items():
+            cantidades_por_mes[med][mes] += cantidad
+
+def read_xls_header(book):
+    sheet = book.sheet_by_index(0)
+    return sheet.row_values(HEADER_ROW) if sheet.nrows > HEADER_ROW else []
+
+# The workbook is opened once: its header row is checked against the required columns (a
+# sheet with an unknown schema fails there, before pandas builds a frame from it) and the
+# same workbook is handed to pandas
+def read_raw_frame(file_path):
+    book = xlrd.open_workbook(file_path, on_demand=True)
     try:
-        # Try casting to datetime safely without side effects
-        pd.to_datetime(fecha, errors="raise", dayfirst=True)
-        return True
-    except:
-        return False
-
-def normalize_column(col):
-    raw = str(col)
-    normalized = unicodedata.normalize("NFKD", raw)
-    clean = "".join(c for c in normalized if not unicodedata.combining(c))
-    return clean.upper().strip().replace("  ", " ")
-
-def extract_from_file(file_path, institucion, fechas_dict, cantidades_por_mes):
+        schema = detect_schema(file_path, lambda _: read_xls_header(book))
+        require_columns(file_path, schema, REQUIRED_COLUMNS)
+        df = pd.read_excel(book, engine="xlrd", header=HEADER_ROW)
+    finally:
+        book.release_resources()
+
+    df = df.loc[:, ~df.columns.astype(str).str.startswith("UNNAMED", na=False)]
+    df.columns = [canonical_column(col) for col in df.columns]
+    # Aliased headers may now share a name; the first one wins, as in column_positions
+    df = df.loc[:, ~df.columns.duplicated()]
+    return df
+
+def load_frame(file_path):
+    df = read_staged(file_path)
+    if df is None:
+        df = read_raw_frame(file_path)
+    return df
+
+# Parses FECHA DE EMISION for every row (NaT where unusable), each distinct value on its own
+# as the sheets mix Excel dates and strings, and reports in one line the bad dates on rows
+# that carry a quantity. Staged frames already hold parsed datetimes, so this is a no-op there.
+def parse_emision(df, file_path):
+    fechas = df[FECHA_COLUMN]
+    parsed = parse_dates(fechas, dayfirst=True, formato=PER_VALUE)
+
+    if MED_COLUMN in df.columns:
+        counted = df[CANTIDAD_COLUMN].notna() if CANTIDAD_COLUMN in df.columns else None
+        report_unparsed(file_path, FECHA_COLUMN, unparsed_values(fechas, parsed, counted))
+
+    return parsed
+
+def stage_file(file_path, institucion):
+    try:
+        df = read_raw_frame(file_path)
+    except Exception as e:
+        print(f"❌ Failed to read {file_path}: {e}")
+        return None
+
+    fingerprint = metadata_store.schema_fingerprint(df.columns)
+    df = df[[col for col in COLUMNS if col in df.columns]].copy()
+    fecha_min = fecha_max = None
+    if FECHA_COLUMN in df.columns:
+        df[FECHA_COLUMN] = parse_emision(df, file_path)
+        fecha_min, fecha_max = metadata_store.date_range(df[FECHA_COLUMN])
+
+    metadata_store.record(
+        file_path, rows=len(df), fecha_min=fecha_min, fecha_max=fecha_max, schema_fingerprint=fingerprint
+    )
+    return write_staged(file_path, df, institucion)
+
+# Returns the top/bottom rows; when `hechos` is given it is filled with the monthly rows and
+# quantities of every medication in the file
+def extract_from_file(file_path, institucion, fechas_dict, cantidades_por_mes, hechos=None):
     try:
-        df = pd.read_excel(file_path, engine="xlrd", header=3)
+        df = load_frame(file_path)
     except Exception as e:
         print(f"❌ Failed to read {file_path}: {e}")
         return []
 
-    df = df.loc[:, ~df.columns.astype(str).str.startswith("UNNAMED", na=False)]
-    df = df.loc[:, ~df.columns.duplicated()]
-    df.columns = [normalize_column(col) for col in df.columns]
-    df.rename(columns={"CANTIDAD  PRESCRITA": "CANTIDAD PRESCRITA"}, inplace=True)
-
-    fecha_archivo_dict = defaultdict(list)
-
-    if "FECHA DE EMISION" in df.columns:
-        for _, row in df.iterrows():
-            med = str(row["DESCRIPCION DEL MEDICAMENTO"]).strip().upper()
-            fecha = row["FECHA DE EMISION"]
-            cantidad = row.get("CANTIDAD PRESCRITA", 0)
-
-            if pd.notnull(fecha) and pd.notnull(cantidad):
-                if not is_parseable_date(fecha):
-                    print(f"⚠️ Skipping toxic date for {med}: {fecha}")
-                    continue
-
-                try:
-                    parsed = pd.to_datetime(fecha, errors="coerce", dayfirst=True)
-                    if pd.isna(parsed):
-                        print(f"⚠️ Could not parse clean-looking date for {med}: {fecha}")
-                        continue
-
-                    fecha_str = str(parsed.date())
-                    fechas_dict[med].add(fecha_str)
-                    fecha_archivo_dict[med].append(fecha_str)
-
-                    month_str = parsed.strftime("%m")
-                    cantidades_por_mes[med][month_str] += int(cantidad)
-                except Exception as e:
-                    print(f"❌ Unexpected parsing crash for {med} — {fecha}: {e}")
-                    continue
-
-    if "DESCRIPCION DEL MEDICAMENTO" not in df.columns or "CANTIDAD PRESCRITA" not in df.columns:
+    fecha_archivo_dict = {}
+    emision = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+
+    if FECHA_COLUMN in df.columns and MED_COLUMN in df.columns:
+        meds = df[MED_COLUMN].map(str).str.strip().str.upper()
+        if CANTIDAD_COLUMN in df.columns:
+            cantidades = df[CANTIDAD_COLUMN]
+        else:
+            cantidades = pd.Series(0, index=df.index)
+
+        # ✅ Parse the whole column once instead of twice per row
+        parsed = emision = parse_emision(df, file_path)
+        ok = parsed.notna() & cantidades.notna()
+        meds, fechas, cantidades, parsed = meds[ok], df[FECHA_COLUMN][ok], cantidades[ok], parsed[ok]
+
+        fecha_str = parsed.dt.strftime("%Y-%m-%d")
+        month_str = parsed.dt.strftime("%Y-%m")
+        cantidades = to_int_cantidades(cantidades, meds, fechas).dropna()
+
+        for med, dias in pd.DataFrame({"med": meds, "fecha": fecha_str}).drop_duplicates().groupby("med", sort=False)["fecha"]:
+            fechas_dict[med].update(dias)
+
+        # First emission date seen per medication, in sheet order
+        fecha_archivo_dict = fecha_str.groupby(meds, sort=False).first().to_dict()
+
+        por_mes = cantidades.groupby([meds[cantidades.index], month_str[cantidades.index]], sort=False).sum()
+        for (med, mes), cantidad in por_mes.items():
+            cantidades_por_mes[med][mes] += int(cantidad)
+
+    if MED_COLUMN not in df.columns or CANTIDAD_COLUMN not in df.columns:
         print(f"⚠️ Missing columns in {file_path}")
         return []
 
-    grouped = df.groupby("DESCRIPCION DEL MEDICAMENTO")["CANTIDAD PRESCRITA"].sum()
-    top10 = grouped.sort_values(ascending=False).head(10)
-    bottom10 = grouped.sort_values(ascending=True).head(10)
+    grouped = df.groupby(MED_COLUMN)[CANTIDAD_COLUMN].sum()
+
+    if hechos is not None:
+        nombres = df[MED_COLUMN].dropna().map(str).str.strip().str.upper()
+        cantidades = datasets.row_values(DATASET, df)
+        hechos.update(monthly_facts(nombres, emision[nombres.index], cantidades[nombres.index]))
 
     result = []
-    for tipo, grupo in [("top", top10), ("bottom", bottom10)]:
+    for tipo, grupo in top_bottom(grouped):
         for medicamento, cantidad in grupo.items():
-            fechas_para_med = fecha_archivo_dict.get(medicamento.strip().upper(), [])
-            fecha_archivo = fechas_para_med[0] if fechas_para_med else "2000-01-01"
+            fecha_archivo = fecha_archivo_dict.get(medicamento.strip().upper(), "2000-01-01")
             result.append({
                 "archivo": os.path.basename(file_path),
                 "tipo": tipo,
@@ -84,30 +187,20 @@ def extract_from_file(file_path, institucion, fechas_dict, cantidades_por_mes):
 
     return result
 
-def fetch_all_prescriptions(download_dir="Webscrapping"):
-    if not os.path.exists(download_dir):
-        raise FileNotFoundError("Webscrapping folder not found")
+def list_files(download_dir="Webscrapping"):
+    return datasets.list_files("meds", download_dir)
 
+def stage_all(download_dir="Webscrapping"):
+    datasets.stage_all("meds", download_dir)
+
+def fetch_all_prescriptions(download_dir="Webscrapping", workers=None):
     all_data = []
     fechas_recetadas_dict = defaultdict(set)
     cantidades_por_mes = defaultdict(lambda: defaultdict(int))
 
-    for file in os.listdir(download_dir):
-        if not file.endswith(".xls"):
-            continue
-
-        file_path = os.path.join(download_dir, file)
-        meta_path = file_path + ".meta.txt"
-
-        institucion = "Desconocida"
-        if os.path.exists(meta_path):
-            with open(meta_path, "r", encoding="utf-8") as f:
-                institucion = f.read().strip()
-
-        meds = extract_from_file(file_path, institucion, fechas_recetadas_dict, cantidades_por_mes)
-
-        if meds:
-            all_data.extend(meds)
+    # Cached per-file summaries; the fact store is synced on the way
+    for summary in datasets.aggregate("meds", download_dir, workers=workers):
+        merge_file_summary(summary, all_data, fechas_recetadas_dict, cantidades_por_mes)
 
     """
     fechas_final = {
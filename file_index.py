@@ -0,0 +1,174 @@
+import csv
+import io
+import os
+import re
+import sqlite3
+import zipfile
+from contextlib import closing
+
+import aggregate_cache
+import datasets
+from csv_loader import ENCODING, open_source, zip_member_path
+import metadata_store
+from http_download import PARTIAL_SUFFIX
+from metadata_store import file_checksum
+
+# SQLite index of what /list-files reports for every file of the data folders. It is
+# refreshed by the scrapers after they write, and by readers only when a folder's own mtime
+# moved (files are always added/replaced by rename, which bumps it), so a listing costs one
+# stat plus two queries (this index and the folder's metadata store for institutions) instead
+# of a scan and a .meta.txt read per file. It lives with the aggregate cache, outside the
+# data folders, so writing it never bumps their mtime.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    sha256 TEXT,
+    dataset TEXT,
+    year INTEGER,
+    PRIMARY KEY (folder, name)
+);
+CREATE TABLE IF NOT EXISTS folders (
+    folder TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL
+);
+"""
+
+META_SUFFIX = ".meta.txt"
+
+YEAR_PATTERN = re.compile(r"(?<!\d)(19\d{2}|20\d{2})(?!\d)")
+
+def index_path():
+    return os.environ.get("FILE_INDEX_DB") or os.path.join(aggregate_cache.CACHE_DIR, "files.sqlite")
+
+def connect():
+    path = index_path()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# Dataset a file belongs to, from its name: for the data files and archives of a registry
+# entry (datasets.dataset_of) its short name, the one its manifest goes by ("recetas",
+# "estudios", "egresos"); "metadata" and "staged" for sidecars and staged copies
+def detect_dataset(name):
+    lower = name.lower()
+    if lower.endswith(META_SUFFIX):
+        return "metadata"
+    if lower.endswith(".parquet"):
+        return "staged"
+    owner = datasets.dataset_of(name)
+    return datasets.get(owner)["manifest"] if owner else "otro"
+
+def _year_in(text):
+    match = YEAR_PATTERN.search(text)
+    return int(match.group(1)) if match else None
+
+# Year from the file name, or else from the dates in the first data row of a CSV
+def detect_year(path):
+    name = os.path.basename(path)
+    year = _year_in(name)
+    if year is not None or name.lower().endswith((META_SUFFIX, ".parquet")):
+        return year
+
+    source = path
+    if name.lower().endswith(".zip"):
+        try:
+            with zipfile.ZipFile(path) as zip_ref:
+                members = [m for m in zip_ref.namelist() if m.lower().endswith(".csv")]
+        except (zipfile.BadZipFile, OSError):
+            return None
+        if not members:
+            return None
+        source = zip_member_path(path, members[0])
+    elif not name.lower().endswith(".csv.gz"):
+        return None
+
+    try:
+        with open_source(source) as raw:
+            reader = csv.reader(io.TextIOWrapper(raw, encoding=ENCODING, newline=""))
+            next(reader, None)
+            row = next(reader, [])
+    except (OSError, EOFError, zipfile.BadZipFile, csv.Error):
+        return None
+
+    for value in row:
+        # Dates only, e.g. 15/03/2020 or 2020-03-15
+        if ("/" in value or "-" in value) and _year_in(value):
+            return _year_in(value)
+    return None
+
+def _listed(entry):
+    return entry.is_file() and not entry.name.startswith(".") and not entry.name.endswith(PARTIAL_SUFFIX)
+
+# Re-indexes the files of `folder` whose size or mtime changed (checksum, dataset, year) and
+# drops the ones that are gone. Only changed files are read.
+def refresh(folder):
+    if not os.path.isdir(folder):
+        return
+
+    key = os.path.abspath(folder)
+    folder_mtime = os.stat(folder).st_mtime_ns
+    entries = {entry.name: entry.stat() for entry in os.scandir(folder) if _listed(entry)}
+
+    with closing(connect()) as conn, conn:
+        known = {
+            row[0]: (row[1], row[2])
+            for row in conn.execute("SELECT name, size, mtime FROM entries WHERE folder = ?", (key,))
+        }
+
+        changed = [
+            name for name, st in entries.items()
+            if known.get(name) != (st.st_size, st.st_mtime_ns)
+        ]
+        for name in changed:
+            st = entries[name]
+            path = os.path.join(folder, name)
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, name, st.st_size, st.st_mtime_ns, file_checksum(path), detect_dataset(name), detect_year(path))
+            )
+
+        gone = [name for name in known if name not in entries]
+        conn.executemany("DELETE FROM entries WHERE folder = ? AND name = ?", [(key, name) for name in gone])
+        conn.execute("INSERT OR REPLACE INTO folders VALUES (?, ?)", (key, folder_mtime))
+
+    if changed or gone:
+        print(f"🗂️ Indexed {folder}: {len(changed)} updated, {len(gone)} removed")
+
+def _needs_refresh(folder):
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT mtime FROM folders WHERE folder = ?", (os.path.abspath(folder),)).fetchone()
+    return row is None or row[0] != os.stat(folder).st_mtime_ns
+
+# Every listed file of `folder` with size, mtime, checksum, institution, dataset and year
+def list_entries(folder):
+    if not os.path.isdir(folder):
+        return []
+    if _needs_refresh(folder):
+        refresh(folder)
+
+    with closing(connect()) as conn:
+        rows = conn.execute(
+            "SELECT name, size, mtime, sha256, dataset, year FROM entries WHERE folder = ? ORDER BY name",
+            (os.path.abspath(folder),)
+        ).fetchall()
+
+    data_files = [row[0] for row in rows if not row[0].endswith(META_SUFFIX)]
+    instituciones = metadata_store.institutions(folder, data_files)
+
+    return [
+        {
+            "name": name,
+            "size": size,
+            "mtime": mtime / 1e9,
+            "sha256": sha256,
+            "institucion": instituciones.get(name),
+            "dataset": dataset,
+            "year": year
+        }
+        for name, size, mtime, sha256, dataset, year in rows
+    ]
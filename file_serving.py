@@ -0,0 +1,49 @@
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, send_file
+from werkzeug.security import safe_join
+
+from http_download import PARTIAL_SUFFIX
+
+# With a front proxy (nginx) that maps this prefix onto the project folder as an internal
+# location, downloads are answered with X-Accel-Redirect and the proxy sends the bytes
+ACCEL_REDIRECT_PREFIX = os.environ.get("DOWNLOAD_ACCEL_PREFIX")
+
+# Apache/lighttpd style: Flask answers with X-Sendfile and the server streams the file
+USE_X_SENDFILE = os.environ.get("DOWNLOAD_X_SENDFILE") == "1"
+
+DOWNLOAD_MAX_AGE = int(os.environ.get("DOWNLOAD_MAX_AGE", "0"))
+
+# Resolves `filename` inside `folder`, refusing anything that could escape it (separators,
+# "..", absolute paths) plus manifests, locks and in-progress downloads. None when the name
+# is not a servable file.
+def resolve_data_file(folder, filename):
+    if not filename or filename.startswith(".") or filename.endswith(PARTIAL_SUFFIX):
+        return None
+    if "/" in filename or "\\" in filename:
+        return None
+
+    path = safe_join(os.path.abspath(folder), filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+def _accel_redirect(folder, filename):
+    response = current_app.response_class(status=200)
+    response.headers["X-Accel-Redirect"] = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(folder)}/{quote(filename)}"
+    response.headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
+
+# Sends a data file as an attachment with ETag / Last-Modified, 304s and byte ranges (206),
+# or hands it to the front proxy when one is configured
+def serve_data_file(folder, filename):
+    path = resolve_data_file(folder, filename)
+    if path is None:
+        return {"error": "File not found"}, 404
+
+    if ACCEL_REDIRECT_PREFIX:
+        return _accel_redirect(folder, filename)
+
+    return send_file(path, as_attachment=True, conditional=True, etag=True, max_age=DOWNLOAD_MAX_AGE)
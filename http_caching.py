@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import os
+from email.utils import formatdate
+from functools import wraps
+from flask import current_app, make_response, request
+
+from aggregate_cache import CACHE_VERSION
+from metadata_store import STORE_FILE, migrate_legacy
+
+# brotli is optional; without it clients are offered gzip only
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Clients may reuse a response this many seconds without asking; after that they revalidate
+# with If-None-Match, which costs a 304 while the data folders are unchanged
+MAX_AGE = int(os.environ.get("API_CACHE_MAX_AGE", "0"))
+
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_SIZE = 500
+
+COMPRESSIBLE_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html")
+
+def _folder_state(folder):
+    if not os.path.isdir(folder):
+        return []
+    # Manifests, locks and in-progress downloads don't change what the API returns; the
+    # metadata store does (institutions)
+    return sorted(
+        (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+        for entry in os.scandir(folder)
+        if (entry.name == STORE_FILE or not entry.name.startswith(".")) and not entry.name.endswith(".part")
+    )
+
+# Picks the response encoding from Accept-Encoding: br when brotli is installed, then gzip
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+# ETag for the current request: names, mtimes and sizes of the data files, the full query
+# string and the negotiated encoding (each encoding is a different representation)
+def data_etag(folders):
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}|{request.full_path}|{negotiate_encoding()}".encode("utf-8"))
+    for folder in folders:
+        for name, mtime, size in _folder_state(folder):
+            digest.update(f"|{folder}/{name}:{mtime}:{size}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+def last_modified(folders):
+    mtimes = [mtime for folder in folders for _, mtime, _ in _folder_state(folder)]
+    return formatdate(max(mtimes) / 1e9, usegmt=True) if mtimes else None
+
+# Tags a route's responses with an ETag / Last-Modified derived from `folders` and answers a
+# matching If-None-Match with a bodiless 304 before the view does any work. Legacy metadata is
+# migrated first, so the view does not change the folder state the ETag was computed from.
+def conditional(*folders):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # The view would migrate legacy .meta.txt sidecars into the store it fingerprints
+            for folder in folders:
+                migrate_legacy(folder)
+            etag = data_etag(folders)
+            if etag in request.if_none_match:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, must-revalidate"
+            modified = last_modified(folders)
+            if modified:
+                response.headers["Last-Modified"] = modified
+            response.vary.add("Accept-Encoding")
+            return response
+        return wrapper
+    return decorator
+
+# after_request hook: compresses JSON/text bodies with the negotiated encoding
+def compress_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=5)
+    else:
+        compressed = gzip.compress(body, compresslevel=6)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
@@ -0,0 +1,311 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import formatdate
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+
+DOWNLOAD_WORKERS = int(os.environ.get("SCRAPE_WORKERS", "4"))
+PER_HOST_LIMIT = int(os.environ.get("SCRAPE_PER_HOST_LIMIT", "4"))
+TOTAL_TIMEOUT = float(os.environ.get("SCRAPE_TIMEOUT", "1800"))
+
+# (connect, read) timeout for a single request
+REQUEST_TIMEOUT = (10, 120)
+
+CHUNK_SIZE = 1024 * 1024
+
+# How many times a download interrupted mid-body is resumed within the same run
+RESUME_ATTEMPTS = 3
+
+PARTIAL_SUFFIX = ".part"
+
+_manifest_lock = threading.Lock()
+
+# Raised inside a download stopped by download_all once its deadline passes
+class DownloadCancelled(Exception):
+    pass
+
+# One pooled session per scrape: keep-alive connections and TLS sessions are reused across
+# files, and connection errors / 429 / 5xx are retried with exponential backoff.
+def make_session(pool_size=DOWNLOAD_WORKERS, retries=3, backoff=0.5):
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"])
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# ------------------ MANIFEST ------------------
+
+# Per-dataset record of every downloaded URL: file, ETag, Last-Modified, size and checksum
+# of the payload, plus the state of an interrupted download that can be resumed.
+def manifest_path(download_dir, dataset):
+    return os.path.join(download_dir, f".{dataset}.manifest.json")
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+def save_manifest(path, manifest):
+    with _manifest_lock:
+        data = json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".manifest.", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _update_manifest(manifest, url, entry):
+    if manifest is None:
+        return
+    with _manifest_lock:
+        if entry:
+            manifest[url] = entry
+        else:
+            manifest.pop(url, None)
+
+def _without_partial(entry):
+    return {k: v for k, v in (entry or {}).items() if k != "partial"}
+
+def _checksum_existing(file_path, compress):
+    digest = hashlib.sha256()
+    opener = gzip.open if compress else open
+    with opener(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+def conditional_headers(entry, file_path):
+    if not os.path.exists(file_path):
+        return {}
+
+    # The local copy no longer matches what was recorded, so fetch it again unconditionally
+    if entry and entry.get("stored_size") not in (None, os.path.getsize(file_path)):
+        return {}
+
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    if not headers:
+        # Files downloaded before the manifest existed: compare against their mtime
+        headers["If-Modified-Since"] = formatdate(os.path.getmtime(file_path), usegmt=True)
+    return headers
+
+def _completed_entry(r, file_path, raw_size, digest, previous=None):
+    previous = previous or {}
+    return {
+        "file": os.path.basename(file_path),
+        "etag": r.headers.get("ETag", previous.get("etag")),
+        "last_modified": r.headers.get("Last-Modified", previous.get("last_modified")),
+        "size": raw_size if raw_size is not None else previous.get("size"),
+        "sha256": digest.hexdigest() if digest else previous.get("sha256"),
+        "stored_size": os.path.getsize(file_path),
+        "downloaded_at": previous.get("downloaded_at") or datetime.now(timezone.utc).isoformat()
+    }
+
+# ------------------ DOWNLOADS ------------------
+
+# Streams `url` into `file_path` chunk by chunk, optionally through a gzip compressor, so
+# memory stays flat whatever the file size and the body is written to disk only once.
+# Bytes go to `<file_path>.part`, which is renamed into place when complete, so readers never
+# see a partial file. With a manifest the request is conditional (304 -> nothing is written)
+# and an interrupted .part is resumed with a Range request. Compressed parts are resumed by
+# appending a new gzip member, which gzip readers decode as one continuous stream.
+# progress(url, file_path, state, bytes_done, total) is called as chunks arrive (total is None
+# when the server sends no Content-Length). Setting the `cancel` event stops the download
+# between chunks with DownloadCancelled, keeping the .part for a later resume.
+# Returns "downloaded" or "not_modified".
+def fetch_to_file(session, url, file_path, compress=False, manifest=None, timeout=REQUEST_TIMEOUT, progress=None, cancel=None):
+    entry = manifest.get(url) if manifest is not None else None
+    part_path = file_path + PARTIAL_SUFFIX
+    partial = (entry or {}).get("partial")
+
+    headers = conditional_headers(entry, file_path) if manifest is not None else {}
+    offset = 0
+    if partial and os.path.exists(part_path) and (partial.get("etag") or partial.get("last_modified")):
+        offset = partial["bytes"]
+        headers = {
+            "Range": f"bytes={offset}-",
+            "If-Range": partial.get("etag") or partial["last_modified"]
+        }
+
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+        if r.status_code == 304:
+            if not _without_partial(entry):
+                # Adopt a file downloaded before the manifest existed
+                entry = _completed_entry(r, file_path, None, _checksum_existing(file_path, compress))
+            _update_manifest(manifest, url, _without_partial(entry))
+            return "not_modified"
+
+        if r.status_code == 416 and offset:
+            # Our partial no longer lines up with the resource, start over
+            os.remove(part_path)
+            _update_manifest(manifest, url, _without_partial(entry))
+            return fetch_to_file(session, url, file_path, compress, manifest, timeout, progress, cancel)
+
+        r.raise_for_status()
+
+        if offset and r.status_code == 206:
+            print(f"⏯️ Resuming {url} at byte {offset}")
+            digest = _checksum_existing(part_path, compress)
+            mode = "ab"
+        else:
+            offset = 0
+            digest = hashlib.sha256()
+            mode = "wb"
+
+        length = r.headers.get("Content-Length")
+        total = offset + int(length) if length and length.isdigit() else None
+
+        downloaded = 0
+        try:
+            with open(part_path, mode) as raw:
+                out = raw
+                if compress:
+                    name = os.path.basename(file_path)
+                    out = gzip.GzipFile(filename=name[:-3] if name.endswith(".gz") else name, mode="wb", fileobj=raw)
+                try:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        if cancel is not None and cancel.is_set():
+                            raise DownloadCancelled(f"download of {url} stopped at the scrape deadline")
+                        out.write(chunk)
+                        digest.update(chunk)
+                        downloaded += len(chunk)
+                        if progress:
+                            progress(url, file_path, "downloading", offset + downloaded, total)
+                finally:
+                    if compress:
+                        out.close()
+        except BaseException:
+            validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+            if manifest is not None and validator:
+                # Keep the .part so the next attempt can ask only for the missing bytes
+                state = dict(entry or {})
+                state["partial"] = {
+                    "bytes": offset + downloaded,
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified")
+                }
+                _update_manifest(manifest, url, state)
+            elif os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+
+    os.chmod(part_path, 0o644)
+    os.replace(part_path, file_path)
+    _update_manifest(manifest, url, _completed_entry(r, file_path, offset + downloaded, digest))
+    return "downloaded"
+
+# Downloads every (url, file_path, on_saved) task with at most `workers` requests in flight
+# and at most `per_host` per host. on_saved(file_path) runs in the worker after a successful
+# download (not for 304s). When `total_timeout` expires, queued tasks are cancelled and running
+# downloads are stopped at their next chunk; they are waited for, so nothing writes to the
+# folder or the manifest after this returns. Tasks that never started, or were stopped, get a
+# TimeoutError / DownloadCancelled; tasks that completed meanwhile keep their status.
+# With compress=True every file is gzip-compressed while streaming (file_path should then
+# end in .gz). With a `manifest_file`, requests are conditional/resumable and that manifest
+# is updated as files complete. `progress` is forwarded to fetch_to_file and also told when a
+# file is queued and when it finishes ("downloaded", "not_modified" or "failed").
+# Returns {url: "downloaded" | "not_modified" | exception}.
+def download_all(session, tasks, workers=DOWNLOAD_WORKERS, per_host=PER_HOST_LIMIT, total_timeout=TOTAL_TIMEOUT, compress=False, manifest_file=None, progress=None):
+    if not tasks:
+        return {}
+
+    manifest = load_manifest(manifest_file) if manifest_file else None
+    host_slots = {urlsplit(url).netloc: threading.Semaphore(per_host) for url, _, _ in tasks}
+    deadline = time.monotonic() + total_timeout
+    cancel = threading.Event()
+
+    def attempt_download(url, file_path):
+        with host_slots[urlsplit(url).netloc]:
+            for attempt in range(1, RESUME_ATTEMPTS + 1):
+                if cancel.is_set() or time.monotonic() > deadline:
+                    raise TimeoutError("scrape deadline reached before download started")
+                print(f"⬇️ Downloading {url}")
+                try:
+                    return fetch_to_file(
+                        session, url, file_path, compress=compress, manifest=manifest, progress=progress, cancel=cancel
+                    )
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == RESUME_ATTEMPTS:
+                        raise
+                    print(f"🔁 Retrying {url} after interrupted download ({e})")
+                finally:
+                    if manifest is not None:
+                        save_manifest(manifest_file, manifest)
+
+    def run(url, file_path, on_saved):
+        try:
+            status = attempt_download(url, file_path)
+        except BaseException:
+            if progress:
+                progress(url, file_path, "failed", None, None)
+            raise
+
+        if progress:
+            progress(url, file_path, status, None, None)
+
+        if status == "not_modified":
+            print(f"⏭️ Not modified: {file_path}")
+            return status
+
+        print(f"✅ Saved: {file_path}")
+        if on_saved:
+            on_saved(file_path)
+        return status
+
+    if progress:
+        for url, file_path, _ in tasks:
+            progress(url, file_path, "queued", 0, None)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = {pool.submit(run, *task): task[0] for task in tasks}
+    _, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+    if not_done:
+        # Stop the running downloads between chunks and wait for them, so they are not still
+        # writing .part files and the manifest once the caller releases the folder
+        cancel.set()
+    pool.shutdown(wait=True, cancel_futures=True)
+
+    # Every future is settled now; the ones still running at the deadline may have finished
+    # saving their file before noticing the cancel, so each keeps its actual outcome
+    results = {}
+    for future, url in futures.items():
+        if future.cancelled():
+            results[url] = TimeoutError("scrape deadline reached before download started")
+            print(f"⌛ Timed out: {url}")
+            continue
+
+        error = future.exception()
+        results[url] = error if error is not None else future.result()
+        if isinstance(error, (DownloadCancelled, TimeoutError)):
+            print(f"⌛ Timed out: {url}")
+        elif error is not None:
+            print(f"❌ Error downloading {url}: {error}")
+
+    return results
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+
+from column_names import normalize_column
+from csv_loader import source_file, source_key
+from http_download import CHUNK_SIZE
+
+# One SQLite file per data folder with everything known about each data file: institution,
+# source URL, download time, checksum, row count, date range and schema fingerprint. It
+# replaces the old one-line .meta.txt sidecars, which are still read (and migrated into the
+# store) for files the store doesn't know yet.
+STORE_FILE = ".metadata.sqlite"
+
+LEGACY_SUFFIX = ".meta.txt"
+
+FIELDS = [
+    "institucion", "source_url", "downloaded_at", "sha256",
+    "rows", "fecha_min", "fecha_max", "schema_fingerprint"
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    institucion TEXT,
+    source_url TEXT,
+    downloaded_at TEXT,
+    sha256 TEXT,
+    rows INTEGER,
+    fecha_min TEXT,
+    fecha_max TEXT,
+    schema_fingerprint TEXT,
+    updated_at TEXT NOT NULL
+);
+"""
+
+def store_path(folder):
+    return os.path.join(folder, STORE_FILE)
+
+# Default rollback journal rather than WAL: reads create no -wal/-shm files, so they don't
+# touch the folder's mtime that file_index watches
+def connect(folder):
+    conn = sqlite3.connect(store_path(folder), timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+# (folder, name) a data file is recorded under; ZIP members as "<zip name>::<member path>"
+def locate(file_path):
+    return os.path.dirname(source_file(file_path)) or ".", source_key(file_path)
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def schema_fingerprint(columns):
+    normalized = "|".join(normalize_column(col) for col in columns)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+# (first, last) date of an already parsed datetime column, as "YYYY-MM-DD"
+def date_range(fechas):
+    fechas = fechas.dropna()
+    if fechas.empty:
+        return None, None
+    return fechas.min().strftime("%Y-%m-%d"), fechas.max().strftime("%Y-%m-%d")
+
+def _upsert(conn, name, fields):
+    unknown = set(fields) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown metadata field(s): {', '.join(sorted(unknown))}")
+
+    columns = list(fields) + ["updated_at"]
+    values = [fields[col] for col in fields] + [now()]
+    updates = ", ".join(f"{col} = excluded.{col}" for col in columns)
+    conn.execute(
+        f"INSERT INTO files (name, {', '.join(columns)}) VALUES (?, {', '.join('?' * len(columns))}) "
+        f"ON CONFLICT(name) DO UPDATE SET {updates}",
+        [name] + values
+    )
+
+# Writes {name: {field: value}} for many files of `folder` in one transaction; fields that
+# are not given keep their stored value
+def record_many(folder, entries):
+    if not entries:
+        return
+    with closing(connect(folder)) as conn, conn:
+        for name, fields in entries.items():
+            _upsert(conn, name, fields)
+
+def record(file_path, **fields):
+    folder, name = locate(file_path)
+    record_many(folder, {name: fields})
+
+# After a download_all run: institution and source URL for every file that is on disk, plus
+# download time and checksum for the ones actually (re)downloaded, all in one transaction
+def record_downloads(folder, tasks, results, institucion):
+    entries = {}
+    for url, file_path, _ in tasks:
+        status = results.get(url)
+        if status not in ("downloaded", "not_modified") or not os.path.exists(file_path):
+            continue
+        fields = {"institucion": institucion, "source_url": url}
+        if status == "downloaded":
+            fields.update(downloaded_at=now(), sha256=file_checksum(file_path))
+        entries[os.path.basename(file_path)] = fields
+
+    record_many(folder, entries)
+    if entries:
+        print(f"🗄️ Metadata saved for {len(entries)} file(s) in {store_path(folder)}")
+
+def _read_legacy(folder, name):
+    meta_path = os.path.join(folder, name + LEGACY_SUFFIX)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+# Copies into the store the institution of every name in `names` that `known` ({name:
+# institucion}, updated in place) lacks and that has a legacy .meta.txt
+def _migrate(conn, folder, names, known):
+    migrated = {}
+    for name in names:
+        if name not in known:
+            institucion = _read_legacy(folder, name)
+            if institucion is not None:
+                migrated[name] = institucion
+
+    if migrated:
+        with conn:
+            for name, institucion in migrated.items():
+                _upsert(conn, name, {"institucion": institucion})
+        print(f"🗄️ Migrated {len(migrated)} .meta.txt sidecar(s) into {store_path(folder)}")
+    known.update(migrated)
+    return len(migrated)
+
+# {name: institucion} for `names` in one query. Names the store has no institution for fall
+# back to their legacy .meta.txt, which is migrated into the store on the way.
+def institutions(folder, names):
+    names = list(names)
+    if not names or not os.path.isdir(folder):
+        return {}
+
+    with closing(connect(folder)) as conn:
+        known = dict(conn.execute("SELECT name, institucion FROM files WHERE institucion IS NOT NULL"))
+        _migrate(conn, folder, names, known)
+    return {name: known[name] for name in names if name in known}
+
+# Creates the store of `folder` and migrates the .meta.txt sidecars of the files it holds, so
+# that reading institutions afterwards no longer writes to the store. Run before a folder is
+# fingerprinted for an ETag. Returns how many sidecars were migrated.
+def migrate_legacy(folder):
+    if not os.path.isdir(folder):
+        return 0
+
+    names = [
+        entry.name[:-len(LEGACY_SUFFIX)] for entry in os.scandir(folder)
+        if entry.name.endswith(LEGACY_SUFFIX) and os.path.exists(os.path.join(folder, entry.name[:-len(LEGACY_SUFFIX)]))
+    ]
+    with closing(connect(folder)) as conn:
+        if not names:
+            return 0
+        known = dict(conn.execute("SELECT name, institucion FROM files WHERE institucion IS NOT NULL"))
+        return _migrate(conn, folder, names, known)
+
+# {name: {field: value}} for every file recorded in `folder`
+def describe(folder):
+    if not os.path.exists(store_path(folder)):
+        return {}
+    with closing(connect(folder)) as conn:
+        conn.row_factory = sqlite3.Row
+        return {row["name"]: {field: row[field] for field in FIELDS} for row in conn.execute("SELECT * FROM files")}
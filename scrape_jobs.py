@@ -0,0 +1,145 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# fcntl locks also keep scrapes from different gunicorn workers out of the same folder
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+JOB_WORKERS = int(os.environ.get("SCRAPE_JOB_WORKERS", "2"))
+
+# How many finished jobs stay queryable through the status endpoint
+MAX_FINISHED_JOBS = 50
+
+LOCK_FILE = ".scrape.lock"
+
+_executor = ThreadPoolExecutor(max_workers=max(1, JOB_WORKERS), thread_name_prefix="scrape-job")
+_lock = threading.Lock()
+_jobs = {}
+_active = {}
+_dir_locks = {}
+
+# Holds the download folder for the whole scrape, so two scrapers sharing a folder (meds and
+# studies both use Webscrapping/) never write or stage files in it at the same time
+@contextmanager
+def directory_lock(download_dir):
+    os.makedirs(download_dir, exist_ok=True)
+    key = os.path.abspath(download_dir)
+    with _lock:
+        thread_lock = _dir_locks.setdefault(key, threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(download_dir, LOCK_FILE), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _progress_recorder(job):
+    def progress(url, file_path, state, bytes_done, total):
+        with _lock:
+            entry = job["files"].setdefault(url, {"file": os.path.basename(file_path), "bytes": 0, "total": None})
+            entry["state"] = state
+            if bytes_done is not None:
+                entry["bytes"] = bytes_done
+            if total is not None:
+                entry["total"] = total
+    return progress
+
+def _run(job, run_scraper, download_dir):
+    with directory_lock(download_dir):
+        with _lock:
+            job["status"] = "running"
+            job["started_at"] = time.time()
+        print(f"🏃 Job {job['id']} started: {job['dataset']}")
+
+        try:
+            run_scraper(download_dir=download_dir, progress=_progress_recorder(job))
+            status, error = "done", None
+            print(f"✅ Job {job['id']} finished: {job['dataset']}")
+        except Exception as e:
+            status, error = "failed", {"error": str(e), "trace": traceback.format_exc()}
+            print(f"❌ Job {job['id']} failed: {job['dataset']}: {e}")
+
+    with _lock:
+        job["status"] = status
+        job["error"] = error
+        job["finished_at"] = time.time()
+        _active.pop(job["dataset"], None)
+        _forget_old_jobs()
+
+def _forget_old_jobs():
+    finished = [j for j in _jobs.values() if j["finished_at"] is not None]
+    finished.sort(key=lambda j: j["finished_at"])
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job["id"]]
+
+# Queues run_scraper(download_dir=..., progress=...) in the background and returns
+# (job, created). A dataset that already has a queued or running job gets that job back
+# instead of a second scrape.
+def submit(dataset, run_scraper, download_dir):
+    with _lock:
+        active_id = _active.get(dataset)
+        if active_id is not None:
+            return snapshot(_jobs[active_id]), False
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "dataset": dataset,
+            "download_dir": download_dir,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "files": {}
+        }
+        _jobs[job["id"]] = job
+        _active[dataset] = job["id"]
+
+    _executor.submit(_run, job, run_scraper, download_dir)
+    print(f"📥 Job {job['id']} queued: {dataset}")
+    return snapshot(job), True
+
+# Copy of the job with totals and elapsed time, safe to serialize while the job keeps running
+def snapshot(job):
+    files = [dict(entry, url=url) for url, entry in job["files"].items()]
+    started = job["started_at"]
+    if started is None:
+        elapsed = 0.0
+    else:
+        elapsed = (job["finished_at"] or time.time()) - started
+
+    return {
+        "id": job["id"],
+        "dataset": job["dataset"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": started,
+        "finished_at": job["finished_at"],
+        "elapsed_seconds": round(elapsed, 3),
+        "bytes_downloaded": sum(f["bytes"] for f in files),
+        "files_done": sum(f.get("state") in ("downloaded", "not_modified") for f in files),
+        "files": files,
+        "error": job["error"]
+    }
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return snapshot(job) if job else None
+
+def list_jobs():
+    with _lock:
+        jobs = sorted(_jobs.values(), key=lambda j: j["created_at"], reverse=True)
+        return [snapshot(job) for job in jobs]
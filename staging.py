@@ -0,0 +1,65 @@
+import os
+import tempfile
+import pandas as pd
+from csv_loader import source_file, split_source
+
+# Parquet needs pyarrow; without it every fetcher keeps reading the raw files
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+STAGED_SUFFIX = ".parquet"
+INSTITUCION_COLUMN = "INSTITUCION"
+
+# A ZIP member is staged next to its archive as "<zip>.<member>.parquet", with the folders of
+# the member path folded into the name
+def staged_path(file_path):
+    zip_path, member = split_source(file_path)
+    if member is None:
+        return file_path + STAGED_SUFFIX
+    return f"{zip_path}.{member.replace('/', '.')}{STAGED_SUFFIX}"
+
+def is_staged(file_path):
+    path = staged_path(file_path)
+    return (
+        PARQUET_AVAILABLE
+        and os.path.exists(path)
+        and os.path.getmtime(path) >= os.path.getmtime(source_file(file_path))
+    )
+
+# Returns the staged frame for `file_path`, or None when there is no up-to-date staged copy
+def read_staged(file_path, columns=None):
+    if not is_staged(file_path):
+        return None
+
+    try:
+        df = pd.read_parquet(staged_path(file_path), columns=columns)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable staged file for {file_path}: {e}")
+        return None
+
+    return df.drop(columns=[INSTITUCION_COLUMN], errors="ignore")
+
+def write_staged(file_path, df, institucion):
+    if not PARQUET_AVAILABLE:
+        return None
+
+    df = df.copy()
+    df[INSTITUCION_COLUMN] = pd.Categorical([institucion] * len(df))
+
+    directory = os.path.dirname(staged_path(file_path)) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".staging.", suffix=STAGED_SUFFIX)
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, staged_path(file_path))
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"⚠️ Could not stage {file_path}: {e}")
+        return None
+
+    print(f"📦 Staged: {staged_path(file_path)}")
+    return staged_path(file_path)
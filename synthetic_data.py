@@ -0,0 +1,187 @@
+import csv
+import datetime
+import gzip
+import os
+import random
+from csv_loader import ENCODING
+
+# Writing .xls needs xlwt (pip install xlwt); without it only the CSV datasets are generated
+try:
+    import xlwt
+    XLS_AVAILABLE = True
+except ImportError:
+    XLS_AVAILABLE = False
+
+# Headers as published, odd accents and spacing included, so the column normalization and
+# aliasing run as they do on the real files
+MEDS_HEADER = [
+    "UNIDAD MÈDICA ", "NIVEL DE ATENCIÒN", "TIPO DE UNIDAD MÉDICA", "NUMERO DE FOLIO DE LA RECETA",
+    "FECHA DE CONSULTA  ", "FECHA DE EMISIÒN", "FECHA DE ENTREGA EN FARMACIA ",
+    "CLAVE DEL MEDICAMENTO COMPENDIO ", "DESCRIPCIÒN DEL MEDICAMENTO", "CANTIDAD  PRESCRITA",
+    "CANTIDAD ENTREGADA ", "RECETAS CERRADAS", "RECETAS ABIERTAS", "CLAVE DEL MEDICO"
+]
+STUDIES_HEADER = [
+    "FECHA DE LA CITA", "SERVICIO", "ESTUDIO", "ENTIDAD DE NACIMIENTO", "ENTIDAD DEL DOMICILIO",
+    "MUNICIPIO DEL DOMICILIO", "ESTADO CIVIL", "OCUPACION", "ESCOLARIDAD", "DERECHOHABIENCIA",
+    "SEGURIDAD SOCIAL", "GÉNERO", "FORMA DE INGRESO", "EDAD (años)", "CLÍNICA", "PROTOCOLO", "CONVENIO"
+]
+EGRESOS_HEADER = [
+    "ENTIDAD", "UNIDAD", "CLUES", "EDAD_ANIOS", "SEXO", "SERVICIO_TRONCAL", "TIPO_DERECHOHABIENTE",
+    "FECHA_INGRESO", "FECHA_EGRESO", "DIAGNOSTICO_PRINCIPAL_CIE10", "DESCRIPCION_CIE_10"
+]
+
+# The prescription sheets carry a title block above the header (fetch_meds.HEADER_ROW)
+MEDS_TITLE = "Instituto Nacional de Neurología y Neurocirugía \nManuel Velasco Suárez  \n\nDirección de Administración \nSubdirección de Recursos Materiales"
+MEDS_HEADER_ROW = 3
+
+# A BIFF8 sheet holds 65536 rows, preamble and header included
+XLS_MAX_ROWS = 65536 - MEDS_HEADER_ROW - 1
+
+DEFAULT_CARDINALITY = {"meds": 400, "studies": 300, "egresos": 2000}
+
+SERVICIOS_TRONCALES = [
+    "Medicina Interna", "Cirugía General", "Ginecología", "Obstetricia", "Pediatría", "Traumatología",
+    "Cardiología", "Neumología", "Urología", "Oncología", "Neurología", "Psiquiatría"
+]
+ENTIDADES = ["CIUDAD DE MÉXICO", "MÉXICO", "MORELOS", "PUEBLA", "HIDALGO", "GUERRERO", "Aguascalientes", "Jalisco"]
+
+# A few names account for most rows, as in the real files, so the top and bottom rankings
+# have something to tell apart
+def _picker(rng, names):
+    weights = [1 / (i + 1) for i in range(len(names))]
+    return lambda k: rng.choices(names, weights=weights, k=k)
+
+def _days(rng, year, k):
+    start = datetime.date(year, 1, 1)
+    return [start + datetime.timedelta(days=rng.randrange(365)) for _ in range(k)]
+
+# Prescription sheet with `rows` prescriptions of `cardinality` medications issued in `year`.
+# Emission dates are Excel dates, with a share of text dates and a few unparseable ones, like
+# the published sheets.
+def write_meds_xls(file_path, rows, cardinality=DEFAULT_CARDINALITY["meds"], year=2023, seed=0,
+                   text_dates=0.01, bad_dates=0.001):
+    if not XLS_AVAILABLE:
+        raise RuntimeError("Writing .xls files needs xlwt (pip install xlwt)")
+    if rows > XLS_MAX_ROWS:
+        raise ValueError(f"An .xls sheet holds at most {XLS_MAX_ROWS} rows below its header")
+
+    rng = random.Random(seed)
+    meds = _picker(rng, [f"MEDICAMENTO {i:04d} {rng.choice((5, 10, 50, 100, 500))}MG. CON {rng.choice((10, 14, 20, 28, 30))}TB." for i in range(cardinality)])
+    fecha_style = xlwt.easyxf(num_format_str="DD/MM/YYYY")
+
+    book = xlwt.Workbook(encoding="utf-8")
+    sheet = book.add_sheet("Recetas")
+    sheet.write(1, 0, MEDS_TITLE)
+    for col, name in enumerate(MEDS_HEADER):
+        sheet.write(MEDS_HEADER_ROW, col, name)
+
+    for i, (med, fecha) in enumerate(zip(meds(rows), _days(rng, year, rows))):
+        row = MEDS_HEADER_ROW + 1 + i
+        folio = f"SP04060YR/ECU/{i // 3:08d}"
+        r = rng.random()
+        sheet.write(row, 0, "INNNMVS")
+        sheet.write(row, 1, "TERCER NIVEL ")
+        sheet.write(row, 2, "INSTITUTO DE SALUD")
+        sheet.write(row, 3, folio)
+        if r < bad_dates:
+            sheet.write(row, 5, f"{fecha.day:02d}{fecha.month:02d}/{fecha.year}")
+        elif r < bad_dates + text_dates:
+            sheet.write(row, 5, fecha.strftime("%d/%m/%Y"))
+        else:
+            sheet.write(row, 5, fecha, fecha_style)
+        sheet.write(row, 6, fecha, fecha_style)
+        sheet.write(row, 7, f"010.000.{rng.randrange(10000):04d}.00")
+        sheet.write(row, 8, med)
+        cantidad = float(rng.randint(1, 90))
+        sheet.write(row, 9, cantidad)
+        sheet.write(row, 10, cantidad)
+        sheet.write(row, 12, "X" if r > 0.5 else "")
+        sheet.write(row, 13, f"YR/ECU/{rng.randrange(100):02d}/22")
+
+    book.save(file_path)
+    return rows
+
+def _write_gz_csv(file_path, header, rows):
+    with gzip.open(file_path, "wt", encoding=ENCODING, newline="", compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+# Laboratory studies file with `rows` appointments of `cardinality` studies in `year`. Dates
+# are ISO timestamps with a share of dd/mm/yyyy ones, and a few rows lack a SERVICIO.
+def write_studies_csv(file_path, rows, cardinality=DEFAULT_CARDINALITY["studies"], year=2023, seed=0,
+                      other_format=0.1, missing_servicio=0.01):
+    rng = random.Random(seed)
+    estudios = _picker(rng, [f"ESTUDIO {i:04d}" for i in range(cardinality)])
+
+    def registros():
+        for estudio, fecha in zip(estudios(rows), _days(rng, year, rows)):
+            r = rng.random()
+            yield [
+                fecha.strftime("%d/%m/%Y") if r < other_format else fecha.strftime("%Y-%m-%dT00:00:00"),
+                "" if r > 1 - missing_servicio else "Laboratorio",
+                estudio,
+                rng.choice(ENTIDADES), rng.choice(ENTIDADES), "COYOACAN", "SOLTERO(A)", "ESTUDIANTE",
+                "SECUNDARIA", "PARTICULAR", "NINGUNA", rng.choice(("MASCULINO", "FEMENINO")),
+                "INICIATIVA PROPIA", rng.randint(0, 95), "SIN ASIGNACIÓN", "", "NIVEL 2"
+            ]
+
+    _write_gz_csv(file_path, STUDIES_HEADER, registros())
+    return rows
+
+# Hospital discharges file with `rows` stays over `cardinality` diagnoses admitted in `year`
+def write_egresos_csv(file_path, rows, cardinality=DEFAULT_CARDINALITY["egresos"], year=2020, seed=0):
+    rng = random.Random(seed)
+    diagnosticos = _picker(rng, [(f"X{i:03d}.0", f"Diagnóstico sintético {i:04d}") for i in range(cardinality)])
+    servicios = _picker(rng, SERVICIOS_TRONCALES)
+
+    def registros():
+        for (clave, descripcion), servicio, ingreso in zip(diagnosticos(rows), servicios(rows), _days(rng, year, rows)):
+            egreso = ingreso + datetime.timedelta(days=rng.randrange(15))
+            yield [
+                rng.choice(ENTIDADES), "001-204-00", "ASIST000016", rng.randint(0, 95),
+                rng.choice(("Hombre", "Mujer")), servicio, "HIJO",
+                ingreso.strftime("%d/%m/%Y"), egreso.strftime("%d/%m/%Y"), clave, descripcion
+            ]
+
+    _write_gz_csv(file_path, EGRESOS_HEADER, registros())
+    return rows
+
+# Writes `files` synthetic files of `rows` rows per dataset under `root`, in the folders and
+# with the names the fetchers look for, and returns {dataset: (folder, total rows)}.
+# `cardinality` (distinct ranked names) defaults per dataset; meds is skipped without xlwt.
+def generate(root, rows, cardinality=None, files=1, seed=0, names=("meds", "studies", "egresos")):
+    webscrapping = os.path.join(root, "Webscrapping")
+    issste = os.path.join(root, "Webscrapping_ISSSTE")
+    os.makedirs(webscrapping, exist_ok=True)
+    os.makedirs(issste, exist_ok=True)
+
+    generated = {}
+    for name in names:
+        distintos = cardinality or DEFAULT_CARDINALITY[name]
+        if name == "meds" and not XLS_AVAILABLE:
+            print("⚠️ xlwt is not installed, skipping the synthetic prescription sheets")
+            continue
+
+        filas = rows
+        if name == "meds" and rows > XLS_MAX_ROWS:
+            filas = XLS_MAX_ROWS
+            print(f"⚠️ Capping the synthetic prescription sheets at {filas} rows")
+
+        total = 0
+        for i in range(files):
+            year = 2000 + i
+            file_seed = seed * 1000 + i
+            if name == "meds":
+                path = os.path.join(webscrapping, f"Recetas_Emitidas_{year}.xls")
+                total += write_meds_xls(path, filas, distintos, year=year, seed=file_seed)
+            elif name == "studies":
+                path = os.path.join(webscrapping, f"Estudios_otorgados_de_Laboratorio_de_Análisis_Clínicos_del_{year}.csv.gz")
+                total += write_studies_csv(path, filas, distintos, year=year, seed=file_seed)
+            else:
+                path = os.path.join(issste, f"egresoshospitalarios_{year}.csv.gz")
+                total += write_egresos_csv(path, filas, distintos, year=year, seed=file_seed)
+            print(f"🧪 Generated: {path}")
+
+        generated[name] = (issste if name == "egresos" else webscrapping, total)
+    return generated
@@ -0,0 +1,25 @@
+import os
+
+import column_names
+
+def test_schema_cache_keeps_only_the_most_recent_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(column_names, "SCHEMA_CACHE_SIZE", 2)
+    monkeypatch.setattr(column_names, "_schemas", column_names.OrderedDict())
+    reads = []
+
+    def read_header(file_path):
+        reads.append(file_path)
+        return ["Fecha de Emision", "CANTIDAD  PRESCRITA"]
+
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"recetas_{i}.xls"
+        path.write_bytes(b"")
+        paths.append(str(path))
+
+    for path in paths[:2] + paths[:1] + paths[2:]:
+        assert column_names.detect_schema(path, read_header) == {"FECHA DE EMISION": 0, "CANTIDAD PRESCRITA": 1}
+
+    # The second file was the least recently used when the third came in
+    assert list(column_names._schemas) == [(p, 0, os.stat(p).st_mtime_ns) for p in (paths[0], paths[2])]
+    assert reads == paths
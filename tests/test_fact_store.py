@@ -0,0 +1,71 @@
+import contextlib
+import gzip
+import io
+import zipfile
+
+import pytest
+
+import aggregate_cache
+import datasets
+import fact_store
+import zip_ingest
+from synthetic_data import write_egresos_csv
+
+OPTIONS = {"filters": {}, "years": None}
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("FACT_DB", str(tmp_path / "facts.sqlite"))
+    monkeypatch.setattr(aggregate_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    aggregate_cache._memory.clear()
+    yield
+    aggregate_cache._memory.clear()
+
+# A folder under `root` holding egresos_hospitalarios.zip with one CSV member of `rows`
+# discharges
+def egresos_zip(root, rows=500):
+    folder = root / "Webscrapping_ISSSTE"
+    folder.mkdir(parents=True)
+    write_egresos_csv(str(root / "egresos.csv.gz"), rows, cardinality=40)
+    with zipfile.ZipFile(folder / "egresos_hospitalarios.zip", "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr("egresoshospitalarios.csv", gzip.open(root / "egresos.csv.gz").read())
+    return folder
+
+def ingest(folder, storage):
+    with contextlib.redirect_stdout(io.StringIO()):
+        zip_ingest.ingest_zip(str(folder / "egresos_hospitalarios.zip"), str(folder), "ISSSTE", storage=storage)
+        return datasets.aggregate("egresos", str(folder))
+
+# Rows stored per archivo (the member and its .csv.gz copy go by different names)
+def total_rows(folder):
+    rows = fact_store.query("egresos.diagnostico", ["archivo"], medida="filas", folder=str(folder))
+    return [row["total"] for row in rows]
+
+# Going from EGRESOS_STORAGE=zip back to gzip swaps the ZIP member for its .csv.gz copy in
+# the listing; the member's facts and rows must go with it, not be counted twice
+@pytest.mark.parametrize("first, second", [("zip", "gzip"), ("gzip", "zip")])
+def test_switching_storage_keeps_one_copy(tmp_path, store, first, second):
+    folder = egresos_zip(tmp_path)
+
+    ingest(folder, first)
+    before = list(fact_store.ranked_rows("egresos", OPTIONS, folder=str(folder)))
+    assert total_rows(folder) == [500]
+
+    ingest(folder, second)
+    after = list(fact_store.ranked_rows("egresos", OPTIONS, folder=str(folder)))
+    assert total_rows(folder) == [500]
+    assert len(after) == len(before)
+    assert [row["cantidad"] for row in after] == [row["cantidad"] for row in before]
+
+    jobs = [file_path for file_path, _ in datasets.list_files("egresos", str(folder))]
+    assert list(aggregate_cache.load_cache("diagnosis_specialities")) == jobs
+
+# Files of another folder are left alone while they exist
+def test_sync_keeps_other_folders(tmp_path, store):
+    first = egresos_zip(tmp_path / "a")
+    second = egresos_zip(tmp_path / "b")
+    ingest(first, "gzip")
+    ingest(second, "gzip")
+
+    assert total_rows(first) == [500]
+    assert total_rows(second) == [500]
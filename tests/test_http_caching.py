@@ -0,0 +1,42 @@
+import contextlib
+import io
+
+import pytest
+from flask import Flask, jsonify
+
+import metadata_store
+from http_caching import conditional
+
+# A folder with one data file whose institution is still in a legacy .meta.txt sidecar, and an
+# app whose route reads it the way the fetchers do
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "datos.csv.gz").write_bytes(b"")
+    (tmp_path / "datos.csv.gz.meta.txt").write_text("INNN", encoding="utf-8")
+
+    app = Flask(__name__)
+
+    @app.route("/datos")
+    @conditional(str(tmp_path))
+    def datos():
+        return jsonify(metadata_store.institutions(str(tmp_path), ["datos.csv.gz"]))
+
+    return app.test_client()
+
+def test_first_response_etag_survives_the_sidecar_migration(client):
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = client.get("/datos")
+        again = client.get("/datos", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert first.get_json() == {"datos.csv.gz": "INNN"}
+    assert again.status_code == 304
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+def test_new_institution_changes_the_etag(client, tmp_path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        first = client.get("/datos")
+        metadata_store.record(str(tmp_path / "datos.csv.gz"), institucion="ISSSTE")
+        again = client.get("/datos", headers={"If-None-Match": first.headers["ETag"]})
+
+    assert again.status_code == 200
+    assert again.get_json() == {"datos.csv.gz": "ISSSTE"}
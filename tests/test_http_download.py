@@ -0,0 +1,161 @@
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_download
+
+BODY = bytes(range(256)) * 256
+ETAG = '"v1"'
+
+# Local server for the downloads. Every path serves BODY with an ETag, answering 304 to a
+# matching If-None-Match and 206 to a Range whose If-Range matches. Paths starting with /slow
+# trickle the body, /cut drops the connection halfway through the first response, and every
+# request waits `delay` seconds while counted as in flight.
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0
+        self.requests = []
+        self.cut = set()
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            self.respond()
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def respond(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+
+        start = 0
+        if self.headers.get("Range") and self.headers.get("If-Range") == ETAG:
+            start = int(self.headers["Range"][len("bytes="):].rstrip("-"))
+        body = BODY[start:]
+
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if self.path.startswith("/cut") and self.path not in self.server.cut:
+            self.server.cut.add(self.path)
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        if self.path.startswith("/slow"):
+            for i in range(0, len(body), 1024):
+                self.wfile.write(body[i:i + 1024])
+                time.sleep(0.05)
+            return
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(http_download, "CHUNK_SIZE", 1024)
+
+def read(path, compress=False):
+    with (gzip.open if compress else open)(path, "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("workers, per_host, expected", [(4, 2, 2), (3, 8, 3)])
+def test_requests_in_flight_stay_under_the_caps(server, tmp_path, workers, per_host, expected):
+    server.delay = 0.2
+    tasks = [(server.url(f"/file{i}.csv"), str(tmp_path / f"file{i}.csv"), None) for i in range(8)]
+
+    results = http_download.download_all(http_download.make_session(), tasks, workers=workers, per_host=per_host)
+
+    assert set(results.values()) == {"downloaded"}
+    assert server.max_in_flight == expected
+
+def test_unchanged_file_is_not_downloaded_again(server, tmp_path):
+    url = server.url("/file.csv")
+    file_path = tmp_path / "file.csv"
+    manifest = str(tmp_path / ".test.manifest.json")
+    saved = []
+    tasks = [(url, str(file_path), saved.append)]
+
+    first = http_download.download_all(http_download.make_session(), tasks, manifest_file=manifest)
+    second = http_download.download_all(http_download.make_session(), tasks, manifest_file=manifest)
+
+    assert first == {url: "downloaded"} and second == {url: "not_modified"}
+    assert saved == [str(file_path)]
+    assert server.requests[-1][1].get("If-None-Match") == ETAG
+    assert read(file_path) == BODY
+    assert json.load(open(manifest))[url]["etag"] == ETAG
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_interrupted_download_resumes_with_range(server, tmp_path, compress):
+    url = server.url("/cut.csv")
+    file_path = tmp_path / ("cut.csv.gz" if compress else "cut.csv")
+    tasks = [(url, str(file_path), None)]
+
+    results = http_download.download_all(
+        http_download.make_session(), tasks, compress=compress, manifest_file=str(tmp_path / ".test.manifest.json")
+    )
+
+    assert results == {url: "downloaded"}
+    ranges = [headers.get("Range") for _, headers in server.requests]
+    assert ranges[0] is None and ranges[1].startswith("bytes=") and ranges[1] != "bytes=0-"
+    assert read(file_path, compress) == BODY
+    assert not (tmp_path / (file_path.name + http_download.PARTIAL_SUFFIX)).exists()
+
+def test_deadline_stops_running_downloads_and_keeps_finished_ones(server, tmp_path):
+    slow, fast = server.url("/slow.csv"), server.url("/fast.csv")
+    manifest = str(tmp_path / ".test.manifest.json")
+    saved = []
+
+    # The fast file is saved before the deadline but its on_saved is still running at it
+    def on_saved(file_path):
+        time.sleep(0.6)
+        saved.append(file_path)
+
+    tasks = [(slow, str(tmp_path / "slow.csv"), None), (fast, str(tmp_path / "fast.csv"), on_saved)]
+    results = http_download.download_all(
+        http_download.make_session(), tasks, workers=2, total_timeout=0.3, manifest_file=manifest
+    )
+
+    assert isinstance(results[slow], http_download.DownloadCancelled)
+    assert results[fast] == "downloaded"
+    assert saved == [str(tmp_path / "fast.csv")]
+    assert not (tmp_path / "slow.csv").exists()
+    partial = json.load(open(manifest))[slow]["partial"]
+    assert 0 < partial["bytes"] < len(BODY)
+    assert (tmp_path / ("slow.csv" + http_download.PARTIAL_SUFFIX)).stat().st_size == partial["bytes"]
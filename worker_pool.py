@@ -0,0 +1,24 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Serial by default; set AGGREGATE_WORKERS (or pass workers=) to spread files over processes
+def default_workers():
+    try:
+        return max(1, int(os.environ.get("AGGREGATE_WORKERS", "1")))
+    except ValueError:
+        return 1
+
+# Runs compute(*job) for every job and returns the results in job order, whatever order
+# the worker processes finish in, so merges downstream stay deterministic.
+def map_jobs(compute, jobs, workers=None):
+    jobs = list(jobs)
+    workers = default_workers() if workers is None else max(1, workers)
+    workers = min(workers, len(jobs))
+
+    if workers <= 1:
+        return [compute(*job) for job in jobs]
+
+    print(f"🧵 Processing {len(jobs)} file(s) with {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(compute, *job) for job in jobs]
+        return [future.result() for future in futures]
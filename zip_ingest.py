@@ -0,0 +1,75 @@
+import os
+import zipfile
+import gzip
+import shutil
+import tempfile
+from http_download import manifest_path, load_manifest, save_manifest, CHUNK_SIZE
+from csv_loader import zip_member_path
+from metadata_store import file_checksum
+import metadata_store
+
+# "gzip" keeps a .csv.gz copy of every CSV member next to the ZIP; "zip" stores the data only
+# once and the fetcher reads the members straight from the archive
+STORAGE = os.environ.get("EGRESOS_STORAGE", "gzip")
+
+# Streams a ZIP member into `<dest>` through gzip without extracting the CSV to disk first
+def compress_member(zip_ref, info, dest):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest) or ".", prefix=".ingest.", suffix=".gz")
+    try:
+        with os.fdopen(fd, "wb") as raw, zip_ref.open(info) as f_in:
+            with gzip.GzipFile(filename=os.path.basename(dest)[:-3], mode="wb", fileobj=raw) as f_out:
+                shutil.copyfileobj(f_in, f_out, CHUNK_SIZE)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Ingests the CSV members of the ZIP, skipping the ones whose CRC and size match what the
+# members record (.<manifest>.members.manifest.json) says was already ingested. Returns the
+# number of members (re)ingested.
+def ingest_zip(zip_path, download_dir, institucion, storage=STORAGE, source_url=None, manifest="egresos"):
+    record_path = manifest_path(download_dir, f"{manifest}.members")
+    record = load_manifest(record_path)
+    ingested = 0
+
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for info in zip_ref.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".csv"):
+                continue
+
+            dest = os.path.join(download_dir, os.path.basename(info.filename) + ".gz")
+            seen = record.get(info.filename, {})
+            up_to_date = (
+                seen.get("crc") == info.CRC
+                and seen.get("size") == info.file_size
+                and seen.get("storage") == storage
+                and (storage != "gzip" or os.path.exists(dest))
+            )
+            if up_to_date:
+                print(f"⏭️ Already ingested: {info.filename}")
+                continue
+
+            if storage == "gzip":
+                print(f"🗜️ Compressing {info.filename} from {zip_path}")
+                compress_member(zip_ref, info, dest)
+                print(f"🗃️ Compressed to: {dest}")
+                metadata_store.record(
+                    dest, institucion=institucion, source_url=source_url,
+                    downloaded_at=metadata_store.now(), sha256=file_checksum(dest)
+                )
+            else:
+                # Drop the old copy so the fetcher reads the member from the archive
+                if os.path.exists(dest):
+                    os.remove(dest)
+                metadata_store.record(
+                    zip_member_path(zip_path, info.filename), institucion=institucion, source_url=source_url,
+                    downloaded_at=metadata_store.now()
+                )
+
+            record[info.filename] = {"crc": info.CRC, "size": info.file_size, "storage": storage}
+            save_manifest(record_path, record)
+            ingested += 1
+
+    return ingested